@@ -1,10 +1,39 @@
 import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent  # app/
 
 
 class BaseConfig:
     APP_NAME = "Open Targets Pathways API"
     DEBUG = False
     CORS_ORIGINS = []
+    # Directory holding the offline GSEA results written by app/scripts/precompute_gsea.py
+    PRECOMPUTED_DIR = Path(
+        os.getenv("PRECOMPUTED_DIR", str(BASE_DIR / "data" / "precomputed"))
+    )
+    # Seconds between rescans of app/data/gmt for new or changed libraries (0 disables)
+    GMT_RELOAD_INTERVAL = float(os.getenv("GMT_RELOAD_INTERVAL", "60"))
+    # Per-disease UMAP embeddings: {UMAP_DATA_DIR}/{embedding}/diseaseId={diseaseId}/*.tsv
+    UMAP_DATA_DIR = Path(os.getenv("UMAP_DATA_DIR", str(BASE_DIR / "data" / "umap")))
+    # Responses smaller than this (bytes) are sent uncompressed; compression level
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "5"))
+    # max-age (seconds) of the library list; clients revalidate with its ETag afterwards
+    LIBRARIES_CACHE_MAX_AGE = int(os.getenv("LIBRARIES_CACHE_MAX_AGE", "3600"))
+    # Number of server worker processes (gunicorn mode when > 1)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # CPU scheduling for GSEA jobs; unset (0) values are derived from the container CPU limit
+    GSEA_CPU_LIMIT = int(os.getenv("GSEA_CPU_LIMIT", "0")) or None
+    GSEA_MAX_PROCESSES = int(os.getenv("GSEA_MAX_PROCESSES", "4"))
+    GSEA_MAX_CONCURRENT_JOBS = int(os.getenv("GSEA_MAX_CONCURRENT_JOBS", "0")) or None
+    GSEA_BLAS_THREADS = int(os.getenv("GSEA_BLAS_THREADS", "1"))
+    # GSEA result cache memory budget (bytes) and eviction policy ("lru" or "lfu")
+    GSEA_CACHE_MAX_BYTES = int(os.getenv("GSEA_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    GSEA_CACHE_POLICY = os.getenv("GSEA_CACHE_POLICY", "lru").lower()
+    # Delta re-ranking: max changed genes before a full run, memory for base signatures
+    GSEA_DELTA_MAX_MOVED_GENES = int(os.getenv("GSEA_DELTA_MAX_MOVED_GENES", "50"))
+    GSEA_DELTA_STATE_MAX_BYTES = int(os.getenv("GSEA_DELTA_STATE_MAX_BYTES", str(64 * 1024 * 1024)))
 
 
 class DevelopmentConfig(BaseConfig):
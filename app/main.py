@@ -6,8 +6,11 @@ from fastapi.responses import FileResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import JSONResponse
 from app.config import get_config
-from app.routers import gsea
+from app.routers import gsea, umap
 from app.scripts.prepare_gene_lists import generate_all_library_gene_lists
+from app.services.library import start_library_watcher
+from app.services.scheduler import get_cpu_scheduler, limit_native_threads
+from app.utils.compression import CompressionMiddleware
 
 import logging
 
@@ -30,6 +33,7 @@ if config.DEBUG:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag"],
     )
 else:
     # In production, use configured origins
@@ -39,15 +43,30 @@ else:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag"],
     )
 
+# zstd/brotli/gzip responses; GSEA result JSON repeats the same names and URLs on every row
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.COMPRESSION_MIN_SIZE,
+    level=config.COMPRESSION_LEVEL,
+)
+
 # Include routers
 app.include_router(gsea.router, prefix="/api", tags=["GSEA"])
+app.include_router(umap.router, prefix="/api", tags=["UMAP"])
 
 
 # Mount static files for the React app
 app.mount("/assets", StaticFiles(directory="./ui/dist/assets"), name="assets")
 
+# Pin BLAS/OpenMP threads before any GSEA work; parallelism comes from blitzgsea processes
+@app.on_event("startup")
+async def configure_cpu_scheduler_startup() -> None:
+    limit_native_threads(config.GSEA_BLAS_THREADS)
+    get_cpu_scheduler()
+
 # Prepare per-library gene lists from GMTs on startup (idempotent and fast if up-to-date)
 @app.on_event("startup")
 async def prepare_gene_lists_startup() -> None:
@@ -60,6 +79,11 @@ async def prepare_gene_lists_startup() -> None:
     except Exception as exc:  # noqa: BLE001
         logger.exception("Failed to prepare gene lists on startup: %s", exc)
 
+# Pick up new or changed GMT libraries without a restart (GMT_RELOAD_INTERVAL)
+@app.on_event("startup")
+async def library_watcher_startup() -> None:
+    start_library_watcher()
+
 @app.get("/")
 async def root():
     return {"message": f"Welcome to {config.APP_NAME}"}
@@ -93,7 +117,8 @@ async def serve_react_app(path: str):
 
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request: Request, exc: StarletteHTTPException):
-    if exc.status_code == 404:
+    # Only rewrite routing misses; keep explicit 404 details (e.g. missing precomputed results)
+    if exc.status_code == 404 and exc.detail == "Not Found":
         return JSONResponse(
             status_code=404,
             content={
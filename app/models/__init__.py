@@ -1,3 +1,17 @@
-from app.models.gsea import Gene, GseaJsonRequest
+from app.models.gsea import (
+    Gene,
+    GseaJsonRequest,
+    OraAllLibrariesResponse,
+    OraJsonRequest,
+    OraLibraryResult,
+    OraResult,
+)
 
-__all__ = ["Gene", "GseaJsonRequest"]
+__all__ = [
+    "Gene",
+    "GseaJsonRequest",
+    "OraAllLibrariesResponse",
+    "OraJsonRequest",
+    "OraLibraryResult",
+    "OraResult",
+]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import List
+from typing import Any, Dict, List
 
 
 class Gene(BaseModel):
@@ -22,3 +22,34 @@ class GseaJsonRequest(BaseModel):
         if not v or len(v) == 0:
             raise ValueError("Genes list cannot be empty")
         return v
+
+
+class OraJsonRequest(BaseModel):
+    """Request model for the over-representation analysis endpoint."""
+
+    genes: List[str] = Field(
+        ..., min_length=1, description="Unranked list of gene symbols (e.g., prioritised targets)"
+    )
+
+
+class OraResult(BaseModel):
+    """ORA results for a single library (response when gmt_name is given)."""
+
+    results: List[Dict[str, Any]] = Field(
+        ..., description="Pathway rows in the GSEA schema, most significant first"
+    )
+    input_overlap: Dict[str, Any] = Field(
+        ..., description="Overlap of the input with the library background"
+    )
+
+
+class OraLibraryResult(OraResult):
+    """ORA results for one library of an all-libraries run."""
+
+    library: str = Field(..., description="GMT library name")
+
+
+class OraAllLibrariesResponse(BaseModel):
+    """ORA response when gmt_name is omitted: one entry per library with any overlap."""
+
+    libraries: List[OraLibraryResult]
@@ -1,5 +1,5 @@
 """API routers for the Pathways API."""
 
-from app.routers import gsea
+from app.routers import gsea, umap
 
-__all__ = ["gsea"]
+__all__ = ["gsea", "umap"]
@@ -1,8 +1,25 @@
-from fastapi import APIRouter, UploadFile, File, Query, HTTPException
+from fastapi import APIRouter, UploadFile, File, Header, Query, HTTPException, Response
 from typing import Literal
-from app.services.gsea import run_gsea_from_dataframe, available_gmt_files
-from app.models.gsea import GseaJsonRequest
+from app.config import get_config
+from app.services.gsea import (
+    run_gsea_keyed,
+    run_gsea_delta,
+    compute_cache_key,
+    get_gsea_cache_stats,
+    permutation_options,
+    PValueMethod,
+)
+from app.services.library import available_gmt_files, get_library, get_library_catalogue
+from app.services.ora import run_ora, run_ora_all_libraries
+from app.services.precomputed import get_precomputed_store
+from app.models.gsea import (
+    GseaJsonRequest,
+    OraAllLibrariesResponse,
+    OraJsonRequest,
+    OraResult,
+)
 from app.utils.gsea_utils import validate_gsea_dataframe, handle_gsea_error
+import hashlib
 import tempfile
 import pandas as pd
 import os
@@ -10,24 +27,168 @@ import numpy as np
 
 router = APIRouter()
 
+AnalysisDirection = Literal["one_sided_positive", "one_sided_negative", "two_sided"]
+
+BASE_KEY_DESCRIPTION = (
+    "cache_key of an earlier analysis of a nearly identical list. Only gene sets "
+    "containing changed genes are recomputed; results are approximate."
+)
+
+PVALUE_METHOD_DESCRIPTION = (
+    "'gamma' fits blitzgsea's null distribution (fast); 'permutation' compares each "
+    "gene set with n_perm random sets of the same size (slower, exact for a given seed). "
+    "NES differs in scale: a z-score of the fitted tail probability for 'gamma', ES over "
+    "the mean null ES of the same sign for 'permutation'."
+)
+
+
+def _run_analysis(
+    df: pd.DataFrame,
+    gmt_name: str,
+    base_key: str | None,
+    pvalue_method: PValueMethod = "gamma",
+    n_perm: int = 1000,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, dict, dict]:
+    """Run a full or delta analysis. Returns results, overlap stats and extra response fields."""
+    if base_key:
+        if pvalue_method != "gamma":
+            raise HTTPException(
+                status_code=400, detail="base_key can only be used with pvalue_method=gamma"
+            )
+        res_df, input_overlap, delta_stats = run_gsea_delta(df, gmt_name, base_key)
+        return res_df, input_overlap, {"cache_key": delta_stats["cache_key"], "delta": delta_stats}
+
+    res_df, input_overlap, cache_key = run_gsea_keyed(
+        df, gmt_name, pvalue_method=pvalue_method, n_perm=n_perm, seed=seed
+    )
+    return res_df, input_overlap, {"cache_key": cache_key}
+
+
+def _result_etag(cache_key: str, analysis_direction: AnalysisDirection) -> str:
+    # Weak: the same result may be serialized or compressed differently
+    return f'W/"{cache_key}-{analysis_direction}"'
+
+
+def _matching_etag(if_none_match: str | None, etags: list[str]) -> str | None:
+    """
+    The first of `etags` listed in an If-None-Match header (weak comparison), if any.
+    "*" matches any current representation, i.e. the first of `etags`.
+    """
+    if not if_none_match:
+        return None
+    listed = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in listed:
+        return etags[0] if etags else None
+    for etag in etags:
+        if etag.removeprefix("W/") in listed:
+            return etag
+    return None
+
+
+def _cached_result_etag(
+    df: pd.DataFrame,
+    gmt_name: str,
+    analysis_direction: AnalysisDirection,
+    base_key: str | None,
+    pvalue_method: PValueMethod,
+    n_perm: int,
+    seed: int,
+    if_none_match: str | None,
+) -> str | None:
+    """
+    ETag of a result the client already holds for this request, from the cache keys
+    the response would carry; no analysis or result cache lookup is needed.
+    """
+    if not if_none_match:
+        return None
+    version = get_library(gmt_name).versioned_name
+    options = permutation_options(pvalue_method, n_perm, seed)
+    keys = [compute_cache_key(df, version, options=options)]
+    if base_key:
+        # A delta request may have been answered by its delta result or a full run
+        keys.append(compute_cache_key(df, version, base_key=base_key))
+    return _matching_etag(if_none_match, [_result_etag(k, analysis_direction) for k in keys])
+
+
+def _format_response(
+    res_df: pd.DataFrame, input_overlap: dict, analysis_direction: AnalysisDirection
+) -> dict:
+    """Filter results by NES direction and build the JSON-safe response body."""
+    # Filter by NES based on analysis direction
+    if analysis_direction == "one_sided_positive":
+        res_df = res_df[res_df["NES"] > 0].copy()
+    elif analysis_direction == "one_sided_negative":
+        res_df = res_df[res_df["NES"] < 0].copy()
+
+    # Replace NaN/Inf with JSON-safe values
+    res_df = res_df.replace([np.inf, -np.inf], None)
+    res_df = res_df.where(pd.notna(res_df), None)
+
+    return {
+        "results": res_df.to_dict(orient="records"),
+        "input_overlap": input_overlap,
+    }
+
 
 @router.get("/gsea/libraries")
-async def list_gmt_files():
-    """List available GMT libraries."""
+async def list_gmt_files(
+    response: Response,
+    if_none_match: str | None = Header(None),
+):
+    """
+    List available GMT libraries.
+
+    Cacheable for LIBRARIES_CACHE_MAX_AGE seconds; the ETag changes whenever a
+    library is added, removed or reloaded.
+    """
+    versions = get_library_catalogue().stats()["libraries"]
+    digest = hashlib.sha256(repr(sorted(versions.items())).encode()).hexdigest()[:32]
+    etag = f'W/"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={get_config().LIBRARIES_CACHE_MAX_AGE}",
+    }
+    if _matching_etag(if_none_match, [etag]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return list(available_gmt_files().keys())
 
 
+@router.get("/gsea/libraries/versions")
+async def list_library_versions():
+    """Current version of each library, versions still loaded and their in-flight jobs."""
+    return get_library_catalogue().stats()
+
+
+@router.get("/gsea/cache/stats")
+async def gsea_cache_stats():
+    """
+    GSEA result cache statistics: entries, bytes, hits, misses and evictions.
+
+    Stats are per worker process (see 'pid'); with WEB_CONCURRENCY > 1 each call
+    reports whichever worker answered.
+    """
+    return get_gsea_cache_stats()
+
+
 @router.post("/gsea/analyze/file")
 def analyze_gsea_from_file(
+    response: Response,
     tsv_file: UploadFile = File(
         ...,
         description="TSV file containing at least 2 columns: 'symbol' and 'globalScore'",
     ),
     gmt_name: str = Query(..., description="GMT library name (without .gmt extension)"),
-    analysis_direction: Literal["one_sided_positive", "one_sided_negative", "two_sided"] = Query(
+    analysis_direction: AnalysisDirection = Query(
         default="one_sided_positive",
         description="Analysis direction: 'one_sided_positive' filters NES > 0, 'one_sided_negative' filters NES < 0, 'two_sided' returns all results"
     ),
+    base_key: str | None = Query(None, description=BASE_KEY_DESCRIPTION),
+    pvalue_method: PValueMethod = Query(default="gamma", description=PVALUE_METHOD_DESCRIPTION),
+    n_perm: int = Query(1000, ge=100, le=100000, description="Permutations per gene set size"),
+    seed: int = Query(0, ge=0, description="Random seed for permutation p-values"),
+    if_none_match: str | None = Header(None),
 ):
     """
     Run GSEA analysis from uploaded TSV file.
@@ -54,8 +215,17 @@ def analyze_gsea_from_file(
         df = pd.read_csv(tsv_path, sep="\t")
         df = validate_gsea_dataframe(df)
 
+        # Answer repeated requests with 304 before running anything
+        etag = _cached_result_etag(
+            df, gmt_name, analysis_direction, base_key, pvalue_method, n_perm, seed, if_none_match
+        )
+        if etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
         # Run GSEA
-        res_df, input_overlap = run_gsea_from_dataframe(df, gmt_name)
+        res_df, input_overlap, extra = _run_analysis(
+            df, gmt_name, base_key, pvalue_method, n_perm, seed
+        )
 
     except HTTPException:
         raise
@@ -66,30 +236,24 @@ def analyze_gsea_from_file(
         if os.path.exists(tsv_path):
             os.unlink(tsv_path)
 
-    # Filter by NES based on analysis direction
-    if analysis_direction == "one_sided_positive":
-        res_df = res_df[res_df["NES"] > 0].copy()
-    elif analysis_direction == "one_sided_negative":
-        res_df = res_df[res_df["NES"] < 0].copy()
-
-    # Replace NaN/Inf with JSON-safe values
-    res_df = res_df.replace([np.inf, -np.inf], None)
-    res_df = res_df.where(pd.notna(res_df), None)
-
-    return {
-        "results": res_df.to_dict(orient="records"),
-        "input_overlap": input_overlap,
-    }
+    response.headers["ETag"] = _result_etag(extra["cache_key"], analysis_direction)
+    return {**_format_response(res_df, input_overlap, analysis_direction), **extra}
 
 
 @router.post("/gsea/analyze/json")
 def analyze_gsea_from_json(
     request: GseaJsonRequest,
+    response: Response,
     gmt_name: str = Query(..., description="GMT library name (without .gmt extension)"),
-    analysis_direction: Literal["one_sided_positive", "one_sided_negative", "two_sided"] = Query(
+    analysis_direction: AnalysisDirection = Query(
         default="one_sided_positive",
         description="Analysis direction: 'one_sided_positive' filters NES > 0, 'one_sided_negative' filters NES < 0, 'two_sided' returns all results"
     ),
+    base_key: str | None = Query(None, description=BASE_KEY_DESCRIPTION),
+    pvalue_method: PValueMethod = Query(default="gamma", description=PVALUE_METHOD_DESCRIPTION),
+    n_perm: int = Query(1000, ge=100, le=100000, description="Permutations per gene set size"),
+    seed: int = Query(0, ge=0, description="Random seed for permutation p-values"),
+    if_none_match: str | None = Header(None),
 ):
     """
     Run GSEA analysis from JSON payload.
@@ -116,25 +280,113 @@ def analyze_gsea_from_json(
         # Validate DataFrame (should already be valid via Pydantic, but double-check)
         df = validate_gsea_dataframe(df)
 
+        # Answer repeated requests with 304 before running anything
+        etag = _cached_result_etag(
+            df, gmt_name, analysis_direction, base_key, pvalue_method, n_perm, seed, if_none_match
+        )
+        if etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
         # Run GSEA directly (no file I/O needed!)
-        res_df, input_overlap = run_gsea_from_dataframe(df, gmt_name)
+        res_df, input_overlap, extra = _run_analysis(
+            df, gmt_name, base_key, pvalue_method, n_perm, seed
+        )
 
     except HTTPException:
         raise
     except Exception as e:
         raise handle_gsea_error(e)
 
-    # Filter by NES based on analysis direction
-    if analysis_direction == "one_sided_positive":
-        res_df = res_df[res_df["NES"] > 0].copy()
-    elif analysis_direction == "one_sided_negative":
-        res_df = res_df[res_df["NES"] < 0].copy()
+    response.headers["ETag"] = _result_etag(extra["cache_key"], analysis_direction)
+    return {**_format_response(res_df, input_overlap, analysis_direction), **extra}
 
-    # Replace NaN/Inf with JSON-safe values
-    res_df = res_df.replace([np.inf, -np.inf], None)
-    res_df = res_df.where(pd.notna(res_df), None)
 
-    return {
-        "results": res_df.to_dict(orient="records"),
-        "input_overlap": input_overlap,
-    }
+@router.post("/gsea/ora", response_model=OraResult | OraAllLibrariesResponse)
+def analyze_ora(
+    request: OraJsonRequest,
+    gmt_name: str | None = Query(
+        None, description="GMT library name (without .gmt extension); all libraries if omitted"
+    ),
+):
+    """
+    Run over-representation analysis (hypergeometric test, BH-corrected) on an
+    unranked gene list. Much faster than GSEA, for a first-pass triage.
+
+    Results use the GSEA schema: ES is the fold enrichment, NES its log2 and
+    'Leading edge genes' the input genes found in each pathway. With gmt_name the
+    response is flat ({"results", "input_overlap"}); without it, each library's
+    results are listed under "libraries" with their "library" name.
+
+    Example:
+        POST /api/gsea/ora?gmt_name=Reactome/ReactomePathways_2025
+        Content-Type: application/json
+        Body: {"genes": ["NOD2", "IL10RA", "IL10RB"]}
+    """
+    try:
+        if gmt_name:
+            res_df, input_overlap = run_ora(request.genes, gmt_name)
+            return _format_response(res_df, input_overlap, "two_sided")
+
+        return {
+            "libraries": [
+                {"library": name, **_format_response(res_df, input_overlap, "two_sided")}
+                for name, res_df, input_overlap in run_ora_all_libraries(request.genes)
+            ]
+        }
+    except Exception as e:
+        raise handle_gsea_error(e)
+
+
+@router.get("/gsea/precomputed/{disease_id}")
+def get_precomputed_gsea(
+    disease_id: str,
+    response: Response,
+    gmt_name: str = Query(..., description="GMT library name (without .gmt extension)"),
+    analysis_direction: AnalysisDirection = Query(
+        default="one_sided_positive",
+        description="Analysis direction: 'one_sided_positive' filters NES > 0, 'one_sided_negative' filters NES < 0, 'two_sided' returns all results"
+    ),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Return precomputed GSEA results for an Open Targets disease association list.
+
+    Results are produced offline for the current data release by
+    `app/scripts/precompute_gsea.py` and read from a memory-mapped store. The ETag
+    only changes with the release, so clients can revalidate cheaply.
+
+    Example:
+        GET /api/gsea/precomputed/EFO_0003767?gmt_name=Reactome/ReactomePathways_2025
+    """
+    store = get_precomputed_store()
+    key = hashlib.sha256(f"{store.release}\x00{disease_id}\x00{gmt_name}".encode()).hexdigest()
+    etag = _result_etag(key[:32], analysis_direction)
+    # A listed ETag was served for this release, so the lookup can be skipped;
+    # "*" only matches once the disease is known to have results
+    if (
+        store.release is not None
+        and _matching_etag(if_none_match, [etag])
+        and "*" not in {tag.strip() for tag in if_none_match.split(",")}
+    ):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        found = store.lookup(disease_id, gmt_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if found is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No precomputed results for disease '{disease_id}' in release {store.release}",
+        )
+
+    if _matching_etag(if_none_match, [etag]):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    res_df, input_overlap = found
+    body = _format_response(res_df, input_overlap, analysis_direction)
+    body["release"] = store.release
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return body
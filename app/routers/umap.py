@@ -0,0 +1,64 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from typing import Literal
+from app.services.umap import get_umap_store, select_points, to_arrow_stream, to_columnar
+
+router = APIRouter()
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+@router.get("/umap/embeddings")
+async def list_embeddings():
+    """List available UMAP embeddings."""
+    return get_umap_store().embeddings()
+
+
+@router.get("/umap/{disease_id}")
+def get_umap_points(
+    disease_id: str,
+    embedding: str = Query(..., description="Embedding name, see /api/umap/embeddings"),
+    format: Literal["arrow", "json"] = Query(
+        default="arrow",
+        description="'arrow' returns an Arrow IPC stream, 'json' parallel arrays",
+    ),
+    zoom: int | None = Query(
+        None, description="Downsample to one point per grid cell at this zoom level (flagged targets are always kept)"
+    ),
+    bbox: str | None = Query(
+        None, description="Viewport as 'x_min,y_min,x_max,y_max'"
+    ),
+):
+    """
+    Return the UMAP coordinates of a disease's targets for client-side (WebGL) rendering.
+
+    Each point has a symbol, float32 x/y, an int32 cluster code (-1 for noise) and a
+    uint8 bitmask of target flags. Cluster names and flag bits are returned as
+    metadata (Arrow schema metadata, or top-level fields in JSON).
+
+    Example:
+        GET /api/umap/EFO_0000094?embedding=Reactome_Pathways_2025_diy_v2&zoom=1
+    """
+    viewport = None
+    if bbox is not None:
+        try:
+            viewport = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be four comma-separated numbers")
+        if len(viewport) != 4:
+            raise HTTPException(status_code=400, detail="bbox must be four comma-separated numbers")
+
+    try:
+        emb = get_umap_store().get(embedding, disease_id)
+        if emb is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No UMAP embedding for disease '{disease_id}' in {embedding}",
+            )
+        idx = select_points(emb, zoom=zoom, bbox=viewport)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "json":
+        return to_columnar(emb, idx)
+    return Response(content=to_arrow_stream(emb, idx), media_type=ARROW_STREAM_MEDIA_TYPE)
@@ -0,0 +1,155 @@
+"""
+Precompute GSEA results for every Open Targets disease x library pair.
+
+Reads the overall direct association scores of a release, runs the same analysis as
+the live endpoints for each disease in a local process pool, and writes a columnar
+store served by `GET /api/gsea/precomputed/{diseaseId}`. With --umap-dir, the
+per-disease UMAP embeddings are also converted to the Arrow files served by the API.
+
+Usage:
+    uv run python -m app.scripts.precompute_gsea --output app/data/precomputed
+    uv run python -m app.scripts.precompute_gsea --associations assoc.parquet --libraries Reactome/ReactomePathways_2025
+    uv run python -m app.scripts.precompute_gsea --umap-dir app/data/umap
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import logging
+import os
+
+import gcsfs
+import pandas as pd
+
+from app.config import get_config
+from app.services.gsea import OT_RELEASE_GCS_PATH, run_gsea_from_dataframe
+from app.services.library import available_gmt_files
+from app.services.precomputed import PrecomputedLibraryWriter, write_manifest
+from app.services.scheduler import limit_native_threads
+from app.services.umap import convert_all_embeddings
+
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_MIN_TARGETS = 10
+
+
+def load_disease_associations(
+    associations_path: str | None = None, min_targets: int = DEFAULT_MIN_TARGETS
+) -> list[tuple[str, pd.DataFrame]]:
+    """
+    Load (diseaseId, symbol, globalScore) rows and split them per disease.
+
+    With no path, the overall direct associations of the configured release are read
+    from GCS and joined to target approved symbols. A local parquet/TSV file with
+    'diseaseId', 'symbol' and 'globalScore' columns can be given instead.
+
+    Returns a list of (diseaseId, DataFrame) sorted by diseaseId, keeping only
+    diseases with at least `min_targets` associated targets.
+    """
+    if associations_path is None:
+        fs = gcsfs.GCSFileSystem()
+        associations = pd.read_parquet(
+            f"{OT_RELEASE_GCS_PATH}/association_overall_direct/",
+            filesystem=fs,
+            columns=["diseaseId", "targetId", "score"],
+        )
+        targets = pd.read_parquet(
+            f"{OT_RELEASE_GCS_PATH}/target/", filesystem=fs, columns=["id", "approvedSymbol"]
+        )
+        df = associations.merge(targets, left_on="targetId", right_on="id", how="inner")
+        df = df.rename(columns={"approvedSymbol": "symbol", "score": "globalScore"})
+    elif associations_path.endswith(".tsv"):
+        df = pd.read_csv(associations_path, sep="\t")
+    else:
+        df = pd.read_parquet(associations_path)
+
+    df = df[["diseaseId", "symbol", "globalScore"]].dropna()
+    sizes = df.groupby("diseaseId")["symbol"].transform("size")
+    df = df[sizes >= min_targets]
+    return [
+        (disease_id, group[["symbol", "globalScore"]].reset_index(drop=True))
+        for disease_id, group in df.groupby("diseaseId", sort=True)
+    ]
+
+
+def _run_disease(args: tuple[str, pd.DataFrame, str]) -> tuple[str, pd.DataFrame | None, dict | None]:
+    disease_id, df, gmt_name = args
+    try:
+        # The pool already uses every core; keep blitzgsea single-process. Each disease
+        # is analysed once, so nothing is kept in the server's caches
+        res_df, overlap_stats = run_gsea_from_dataframe(
+            df, gmt_name, processes=1, use_cache=False
+        )
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Skipping %s for %s: %s", disease_id, gmt_name, exc)
+        return disease_id, None, None
+    return disease_id, res_df, overlap_stats
+
+
+def precompute(
+    output_dir: Path,
+    diseases: list[tuple[str, pd.DataFrame]],
+    libraries: list[str],
+    release: str,
+    workers: int,
+) -> Path:
+    """Run GSEA for each disease x library and write the store plus its manifest."""
+    manifest_entries: dict[str, dict] = {}
+    # One single-threaded blitzgsea run per worker; the pool provides the parallelism.
+    # The server's CPU scheduler is not used: it shares one worker process's budget
+    # between concurrent requests, while this batch owns the machine and is fastest
+    # with one independent disease per core and no processes spawned per run
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=limit_native_threads, initargs=(1,)
+    ) as pool:
+        for gmt_name in libraries:
+            LOGGER.info("Precomputing %d diseases for %s", len(diseases), gmt_name)
+            writer = PrecomputedLibraryWriter(output_dir, gmt_name)
+            tasks = ((disease_id, df, gmt_name) for disease_id, df in diseases)
+            # map() preserves input order, so diseases are written sorted
+            for disease_id, res_df, overlap_stats in pool.map(_run_disease, tasks, chunksize=8):
+                if res_df is not None:
+                    writer.add(disease_id, res_df, overlap_stats)
+            manifest_entries[gmt_name] = writer.close()
+            LOGGER.info(
+                "Wrote %d diseases (%d rows) for %s",
+                manifest_entries[gmt_name]["diseases"], manifest_entries[gmt_name]["rows"], gmt_name,
+            )
+    return write_manifest(output_dir, release, manifest_entries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", type=Path, default=get_config().PRECOMPUTED_DIR)
+    parser.add_argument("--associations", help="Local parquet/TSV with diseaseId, symbol, globalScore")
+    parser.add_argument("--libraries", nargs="*", help="Library names (default: all available)")
+    parser.add_argument("--diseases", nargs="*", help="Restrict to these disease IDs")
+    parser.add_argument("--min-targets", type=int, default=DEFAULT_MIN_TARGETS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--release", default=OT_RELEASE_GCS_PATH.split("/")[1])
+    parser.add_argument("--umap-dir", type=Path, help="Also convert the UMAP embeddings under this directory")
+    args = parser.parse_args()
+
+    if args.umap_dir:
+        converted = convert_all_embeddings(args.umap_dir)
+        LOGGER.info("Converted %d UMAP embeddings under %s", converted, args.umap_dir)
+
+    available = list(available_gmt_files().keys())
+    libraries = args.libraries or available
+    unknown = sorted(set(libraries) - set(available))
+    if unknown:
+        parser.error(f"Unknown libraries {unknown}. Choose from: {available}")
+
+    diseases = load_disease_associations(args.associations, args.min_targets)
+    if args.diseases:
+        wanted = set(args.diseases)
+        diseases = [(d, df) for d, df in diseases if d in wanted]
+    LOGGER.info("Loaded associations for %d diseases", len(diseases))
+
+    manifest = precompute(args.output, diseases, libraries, args.release, args.workers)
+    LOGGER.info("Precomputed store written: %s", manifest)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,5 +1,7 @@
 from pathlib import Path
 import logging
+import os
+import tempfile
 
 
 BASE_DIR = Path(__file__).resolve().parents[1]  # app/
@@ -43,10 +45,14 @@ def generate_background_for_gmt(gmt_path: Path, suffix: str = "_background") ->
 
     genes = _collect_genes_from_gmt_file(gmt_path)
 
-    # Write without header, one gene per line, sorted for determinism
-    with out_path.open("w") as f:
+    # Write without header, one gene per line, sorted for determinism. Written to a
+    # unique temp file and renamed, since several workers may regenerate it at once.
+    with tempfile.NamedTemporaryFile(
+        "w", dir=out_path.parent, prefix=f".{out_path.name}.", delete=False
+    ) as f:
         for gene in sorted(genes):
             f.write(f"{gene}\n")
+    os.replace(f.name, out_path)
 
     return out_path
 
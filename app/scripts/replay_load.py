@@ -0,0 +1,397 @@
+"""
+Replay a request trace against the API and report latency, throughput and memory.
+
+The trace is a JSONL file with one request per line:
+    {"method": "POST", "path": "/api/gsea/analyze/json", "params": {...}, "json": {...}}
+Optional fields are "headers" and "offset" (seconds from the start of the trace,
+honoured with --speed). Without --trace, one is synthesised from the bundled test
+TSV: perturbed variants of the list across all libraries and directions, with a
+skewed variant mix so that some requests repeat (and hit the result cache).
+
+Requests go to the app in-process (httpx ASGITransport, the default) or to a running
+server with --url.
+
+Usage:
+    uv run python -m app.scripts.replay_load --requests 200 --concurrency 8
+    uv run python -m app.scripts.replay_load --trace trace.jsonl --url http://localhost:8000 --pid 1234
+    uv run python -m app.scripts.replay_load --write-trace trace.jsonl --requests 500
+"""
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from app.config import BASE_DIR
+from app.services.library import available_gmt_files
+
+
+LOGGER = logging.getLogger(__name__)
+TEST_TSV = (
+    BASE_DIR / "data" / "test_input_gsea"
+    / "OT-EFO_0003767-associated-targets-13_08_2025-v25_06.tsv"
+)
+DIRECTIONS = ["one_sided_positive", "one_sided_negative", "two_sided"]
+CACHE_STATS_PATH = "/api/gsea/cache/stats"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# --- Traces ---
+def load_trace(path: Path) -> list[dict]:
+    """Read a JSONL trace, skipping blank lines."""
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def synthesise_trace(
+    n_requests: int,
+    libraries: list[str],
+    variants: int = 5,
+    seed: int = 0,
+    tsv_path: Path = TEST_TSV,
+) -> list[dict]:
+    """
+    Build a trace of GSEA JSON requests from the test TSV.
+
+    Each variant drops a random 5% of the genes and jitters the scores, so variants
+    have distinct cache keys; variant i is drawn with weight 1 / (i + 1).
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(tsv_path, sep="\t")[["symbol", "globalScore"]].dropna()
+
+    payloads = []
+    for i in range(variants):
+        variant = df if i == 0 else df.sample(frac=0.95, random_state=seed + i)
+        scores = variant["globalScore"].to_numpy(dtype=float)
+        if i:
+            scores = scores * rng.uniform(0.98, 1.02, len(scores))
+        payloads.append({
+            "genes": [
+                {"symbol": s, "globalScore": float(v)}
+                for s, v in zip(variant["symbol"], scores)
+            ]
+        })
+
+    weights = 1.0 / np.arange(1, variants + 1)
+    picks = rng.choice(variants, size=n_requests, p=weights / weights.sum())
+    return [
+        {
+            "method": "POST",
+            "path": "/api/gsea/analyze/json",
+            "params": {
+                "gmt_name": libraries[rng.integers(len(libraries))],
+                "analysis_direction": DIRECTIONS[rng.integers(len(DIRECTIONS))],
+            },
+            "json": payloads[v],
+        }
+        for v in picks
+    ]
+
+
+def write_trace(trace: list[dict], path: Path) -> None:
+    with open(path, "w") as fh:
+        for entry in trace:
+            fh.write(json.dumps(entry) + "\n")
+
+
+# --- Memory ---
+def process_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and its children (0 if unavailable)."""
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            rss = int(fh.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+    # Forked workers (gunicorn) and GSEA process pools count too
+    for task in Path(f"/proc/{pid}/task").glob("*/children"):
+        try:
+            children = task.read_text().split()
+        except OSError:
+            continue
+        rss += sum(process_rss(int(child)) for child in children)
+    return rss
+
+
+async def _sample_rss(pid: int, samples: list[int], interval: float) -> None:
+    while True:
+        samples.append(process_rss(pid))
+        await asyncio.sleep(interval)
+
+
+# --- Replay ---
+@asynccontextmanager
+async def open_client(url: str | None, timeout: float):
+    """HTTP client for a running server, or the in-process app with its startup hooks run."""
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://replay", timeout=timeout
+        ) as client:
+            yield client
+
+
+async def _send(client: httpx.AsyncClient, entry: dict) -> tuple[float, int | None]:
+    start = time.perf_counter()
+    try:
+        response = await client.request(
+            entry.get("method", "GET"),
+            entry["path"],
+            params=entry.get("params"),
+            json=entry.get("json"),
+            headers=entry.get("headers"),
+        )
+        status = response.status_code
+    except httpx.HTTPError as exc:
+        LOGGER.debug("Request to %s failed: %s", entry["path"], exc)
+        status = None
+    return time.perf_counter() - start, status
+
+
+async def _cache_stats(client: httpx.AsyncClient) -> dict | None:
+    try:
+        response = await client.get(CACHE_STATS_PATH)
+        response.raise_for_status()
+        return response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def replay(
+    trace: list[dict],
+    url: str | None = None,
+    concurrency: int = 4,
+    speed: float = 0.0,
+    warmup: int = 0,
+    pid: int | None = None,
+    timeout: float = 300.0,
+) -> dict:
+    """
+    Replay a trace and return the measured report.
+
+    With speed > 0, requests are sent at their trace "offset" divided by speed
+    (open loop, still at most `concurrency` in flight); otherwise as fast as
+    `concurrency` workers allow. The first `warmup` requests run sequentially and
+    are not measured.
+    """
+    if pid is None and url is None:
+        pid = os.getpid()
+
+    async with open_client(url, timeout) as client:
+        for entry in trace[:warmup]:
+            await _send(client, entry)
+        measured = trace[warmup:]
+
+        stats_before = await _cache_stats(client)
+        rss_samples: list[int] = []
+        sampler = (
+            asyncio.create_task(_sample_rss(pid, rss_samples, 0.5)) if pid else None
+        )
+        rss_before = process_rss(pid) if pid else 0
+
+        latencies = np.zeros(len(measured))
+        statuses: list[int | None] = [None] * len(measured)
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+
+        async def run(i: int, entry: dict) -> None:
+            if speed > 0 and "offset" in entry:
+                delay = entry["offset"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with semaphore:
+                latencies[i], statuses[i] = await _send(client, entry)
+
+        await asyncio.gather(*(run(i, entry) for i, entry in enumerate(measured)))
+        elapsed = time.perf_counter() - started
+
+        if sampler is not None:
+            sampler.cancel()
+        rss_after = process_rss(pid) if pid else 0
+        stats_after = await _cache_stats(client)
+
+    return build_report(
+        measured, latencies, statuses, elapsed,
+        stats_before, stats_after, rss_before, rss_after, max(rss_samples, default=0),
+    )
+
+
+def _latency_summary(latencies: np.ndarray) -> dict:
+    if len(latencies) == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": int(len(latencies)),
+        "p50_ms": round(p50 * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "p99_ms": round(p99 * 1000, 1),
+        "max_ms": round(float(latencies.max()) * 1000, 1),
+    }
+
+
+def build_report(
+    trace: list[dict],
+    latencies: np.ndarray,
+    statuses: list[int | None],
+    elapsed: float,
+    stats_before: dict | None,
+    stats_after: dict | None,
+    rss_before: int,
+    rss_after: int,
+    rss_peak: int,
+) -> dict:
+    ok = np.array([s is not None and (200 <= s < 300 or s == 304) for s in statuses], dtype=bool)
+    status_counts: dict[str, int] = {}
+    for s in statuses:
+        key = str(s) if s is not None else "error"
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    by_endpoint = {}
+    labels = np.array([
+        f"{e.get('method', 'GET')} {e['path']} {e.get('params', {}).get('gmt_name', '')}".strip()
+        for e in trace
+    ])
+    for label in sorted(set(labels)):
+        by_endpoint[label] = _latency_summary(latencies[labels == label])
+
+    cache = None
+    if (
+        stats_before is not None and stats_after is not None
+        # Stats are per worker; a delta across two workers is meaningless
+        and stats_before.get("pid") == stats_after.get("pid")
+    ):
+        hits = stats_after["hits"] - stats_before["hits"]
+        misses = stats_after["misses"] - stats_before["misses"]
+        cache = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "pid": stats_after.get("pid"),
+            "entries": stats_after.get("entries"),
+            "bytes": stats_after.get("bytes"),
+        }
+
+    return {
+        "requests": len(trace),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(trace) / elapsed, 2) if elapsed else None,
+        "error_rate": round(float((~ok).mean()), 4) if len(trace) else 0.0,
+        "status_counts": status_counts,
+        "latency": _latency_summary(latencies),
+        "by_endpoint": by_endpoint,
+        "cache": cache,
+        "memory": {
+            "rss_before_mb": round(rss_before / 2**20, 1),
+            "rss_after_mb": round(rss_after / 2**20, 1),
+            "rss_peak_mb": round(max(rss_peak, rss_after) / 2**20, 1),
+            "rss_growth_mb": round((rss_after - rss_before) / 2**20, 1),
+        } if rss_before else None,
+    }
+
+
+def format_report(report: dict) -> str:
+    lat = report["latency"]
+    lines = [
+        f"Requests:    {report['requests']} in {report['elapsed_s']} s "
+        f"({report['throughput_rps']} req/s)",
+        f"Errors:      {report['error_rate']:.2%}  {report['status_counts']}",
+    ]
+    if lat["count"]:
+        lines.append(
+            f"Latency:     p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  "
+            f"p99 {lat['p99_ms']} ms  max {lat['max_ms']} ms"
+        )
+    if report["cache"]:
+        c = report["cache"]
+        lines.append(f"Cache:       {c['hits']} hits / {c['misses']} misses (hit ratio {c['hit_ratio']})")
+    if report["memory"]:
+        m = report["memory"]
+        lines.append(
+            f"Memory:      RSS {m['rss_before_mb']} -> {m['rss_after_mb']} MB "
+            f"(growth {m['rss_growth_mb']} MB, peak {m['rss_peak_mb']} MB)"
+        )
+    for label, summary in report["by_endpoint"].items():
+        lines.append(
+            f"  {label}: n={summary['count']} p50 {summary.get('p50_ms')} ms "
+            f"p95 {summary.get('p95_ms')} ms"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trace", type=Path, help="JSONL trace to replay (default: synthesised)")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--pid", type=int, help="Server PID whose RSS to track with --url")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay trace offsets at this speed-up (0: closed loop)")
+    parser.add_argument("--warmup", type=int, default=0, help="Unmeasured requests sent first")
+    parser.add_argument("--requests", type=int, default=100, help="Synthesised trace length")
+    parser.add_argument("--variants", type=int, default=5, help="Distinct gene lists in a synthesised trace")
+    parser.add_argument("--libraries", nargs="*", help="Libraries of a synthesised trace (default: all available)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--write-trace", type=Path, help="Write the trace to this file and exit")
+    parser.add_argument("--output", type=Path, help="Also write the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit 1 if p95 latency is above this")
+    parser.add_argument("--min-throughput", type=float, help="Exit 1 if throughput (req/s) is below this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Exit 1 if the error rate is above this")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        available = list(available_gmt_files().keys())
+        libraries = args.libraries or available
+        unknown = sorted(set(libraries) - set(available))
+        if unknown:
+            parser.error(f"Unknown libraries {unknown}. Choose from: {available}")
+        trace = synthesise_trace(args.requests, libraries, args.variants, args.seed)
+
+    if args.write_trace:
+        write_trace(trace, args.write_trace)
+        LOGGER.info("Wrote %d requests to %s", len(trace), args.write_trace)
+        return
+
+    LOGGER.info(
+        "Replaying %d requests (concurrency %d) against %s",
+        len(trace), args.concurrency, args.url or "in-process app",
+    )
+    report = asyncio.run(replay(
+        trace, url=args.url, concurrency=args.concurrency, speed=args.speed,
+        warmup=args.warmup, pid=args.pid, timeout=args.timeout,
+    ))
+    print(format_report(report))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    failures = []
+    if report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.2%}")
+    if args.max_p95_ms is not None and report["latency"].get("p95_ms", 0) > args.max_p95_ms:
+        failures.append(f"p95 {report['latency']['p95_ms']} ms")
+    if args.min_throughput is not None and (report["throughput_rps"] or 0) < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']} req/s")
+    if failures:
+        LOGGER.error("Load test failed: %s", ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,15 +1,24 @@
 """Service layer for the Pathways API."""
 
 from app.services.gsea import (
-    available_gmt_files,
+    compute_cache_key,
+    get_gsea_cache_stats,
     run_gsea,
     run_gsea_from_dataframe,
-    load_custom_gmt,
+    run_gsea_keyed,
+    run_gsea_delta,
+    preload_shared_data,
 )
+from app.services.library import available_gmt_files, load_custom_gmt
 
 __all__ = [
     "available_gmt_files",
+    "compute_cache_key",
+    "get_gsea_cache_stats",
     "run_gsea",
     "run_gsea_from_dataframe",
+    "run_gsea_keyed",
+    "run_gsea_delta",
     "load_custom_gmt",
+    "preload_shared_data",
 ]
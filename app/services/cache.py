@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Any, Literal
+import json
+import logging
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EvictionPolicy = Literal["lru", "lfu"]
+
+
+def estimate_result_size(res_df: pd.DataFrame, overlap_stats: dict) -> int:
+    """Measured size in bytes of a cached (results, overlap_stats) pair, including string payloads."""
+    return int(res_df.memory_usage(index=True, deep=True).sum()) + len(
+        json.dumps(overlap_stats, default=str)
+    )
+
+
+class ResultCache:
+    """
+    Thread-safe cache bounded by total measured size rather than entry count.
+
+    Entries are evicted until the new entry fits within max_bytes, either least
+    recently used ('lru') or least frequently used ('lfu', ties broken by recency).
+    Entries larger than the whole budget are not cached.
+    """
+
+    def __init__(self, max_bytes: int, policy: EvictionPolicy = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache eviction policy: {policy!r}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # key -> (value, size_bytes); ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._frequency: dict[str, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            self._frequency[key] += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, size_bytes: int) -> bool:
+        """Store value under key. Returns False if it is too large to cache."""
+        if size_bytes > self.max_bytes:
+            logger.info(
+                "Not caching %s: %d bytes exceeds cache budget of %d bytes",
+                key[:12], size_bytes, self.max_bytes,
+            )
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size_bytes > self.max_bytes:
+                self._remove(self._victim())
+                self._evictions += 1
+            self._entries[key] = (value, size_bytes)
+            self._frequency[key] = 1
+            self._bytes += size_bytes
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._frequency.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "policy": self.policy,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+    def _victim(self) -> str:
+        if self.policy == "lru":
+            return next(iter(self._entries))
+        # min() returns the first minimum, i.e. the least recently used among the least frequent
+        return min(self._entries, key=self._frequency.__getitem__)
+
+    def _remove(self, key: str) -> None:
+        _, size_bytes = self._entries.pop(key)
+        del self._frequency[key]
+        self._bytes -= size_bytes
@@ -1,259 +1,301 @@
 from pathlib import Path
-from collections import OrderedDict
+from typing import Literal
 import hashlib
 import json
 import logging
-import threading
+import os
 
 import numpy as np
 import blitzgsea as blitz
-import gcsfs
 import pandas as pd
 
+from app.config import get_config
+from app.services.cache import ResultCache, estimate_result_size
+from app.services.library import (
+    CompiledLibrary,
+    available_gmt_files,  # noqa: F401 (re-exported)
+    get_library,
+    library_lease,
+    load_custom_gmt,  # noqa: F401 (re-exported)
+    preload_libraries,
+)
+from app.services.permutation import permutation_gsea
+from app.services.rerank import EngineState, cached_null_model, discard_null_model, rerank
+from app.services.scheduler import get_cpu_scheduler
+from app.services.symbols import (
+    OT_RELEASE_GCS_PATH,  # noqa: F401 (re-exported)
+    get_approved_symbols_from_gcs,  # noqa: F401 (re-exported)
+    get_symbol_vocabulary,
+)
+
 logger = logging.getLogger(__name__)
 
-BASE_DIR = Path(__file__).resolve().parents[1]  # app/
-DATA_DIR = BASE_DIR / "data"
-GMT_DIR = DATA_DIR / "gmt"
-MIN_GENE_COL_IDX = 2
+# 'gamma': blitzgsea's fitted null (fast); 'permutation': random gene sets (exact, seeded)
+PValueMethod = Literal["gamma", "permutation"]
 
 # --- Caches ---
-_approved_symbols_cache: set[str] | None = None
-_approved_symbols_lock = threading.Lock()
-
-_GSEA_CACHE_MAX_SIZE = 50
-_gsea_cache: OrderedDict[str, tuple[pd.DataFrame, dict]] = OrderedDict()
-_gsea_cache_lock = threading.Lock()
+# Result cache bounded by measured size, see GSEA_CACHE_MAX_BYTES / GSEA_CACHE_POLICY
+_gsea_cache = ResultCache(
+    max_bytes=get_config().GSEA_CACHE_MAX_BYTES, policy=get_config().GSEA_CACHE_POLICY
+)
+# Ranked signatures and raw engine output of recent runs, for delta re-ranking
+_engine_states = ResultCache(max_bytes=get_config().GSEA_DELTA_STATE_MAX_BYTES)
+
+
+def compute_cache_key(
+    df: pd.DataFrame,
+    gmt_name: str,
+    base_key: str | None = None,
+    options: dict | None = None,
+) -> str:
+    """
+    Hash of the input genes (in symbol order) and library version ('name@v<hash>', see
+    overlap_stats["library_version"]), so results of a reloaded library are never
+    served from the old version's entries. Delta results (approximate)
+    are keyed by their base as well so they are never served for a full analysis of
+    the same input. `options` (e.g. the permutation settings) are hashed when given.
+    """
+    symbols = df["symbol"].astype(str).to_numpy()
+    order = np.argsort(symbols, kind="stable")
+    h = hashlib.sha256()
+    h.update("\x00".join(symbols[order]).encode())
+    h.update(df["globalScore"].to_numpy(dtype="<f8")[order].tobytes())
+    params = {"gmt": gmt_name, "base": base_key}
+    if options:
+        params["options"] = options
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def get_gsea_cache_stats() -> dict:
+    """
+    Entries, bytes, hits, misses and evictions of this process's GSEA result cache.
+    Each worker process has its own cache, identified by 'pid'.
+    """
+    return {"pid": os.getpid(), **_gsea_cache.stats()}
 
 
-def _compute_cache_key(df: pd.DataFrame, gmt_name: str) -> str:
-    sorted_genes = sorted(
-        ([str(s), float(sc)] for s, sc in df[["symbol", "globalScore"]].values),
-        key=lambda x: x[0],
-    )
-    key_data = json.dumps({"genes": sorted_genes, "gmt": gmt_name}, sort_keys=True)
-    return hashlib.sha256(key_data.encode()).hexdigest()
-
+def preload_shared_data() -> list[str]:
+    """
+    Compile every GMT library and fetch approved symbols and aliases up front.
 
-def get_approved_symbols_from_gcs() -> set[str]:
+    Called in the gunicorn master before workers are forked (see gunicorn.conf.py),
+    so all workers share the same pages copy-on-write instead of each loading its
+    own copy. Returns the names of the compiled libraries.
     """
-    Read approvedSymbol column from Open Targets target parquet files in GCS using gcsfs.
-    Returns a set of approved gene symbols. Result is cached for the lifetime of the process.
+    names = preload_libraries()
+    get_symbol_vocabulary()
+    for name in names:
+        library = get_library(name)
+        _get_background_codes(library)
+        _term_annotations(library)
+    return names
+
+
+def _get_background_codes(library: CompiledLibrary) -> np.ndarray:
+    """Vocabulary codes of the library's approved background genes (ascending)."""
+    codes = library.derived.get("background_codes")
+    if codes is None:
+        codes = get_symbol_vocabulary().encode(pd.Series(library.universe))
+        # universe and vocabulary are both sorted, so codes are ascending
+        codes = codes[codes >= 0]
+        library.derived["background_codes"] = codes
+    return codes
+
+
+def match_symbols(symbols: pd.Series) -> tuple[np.ndarray, dict]:
     """
-    global _approved_symbols_cache
-    if _approved_symbols_cache is not None:
-        return _approved_symbols_cache
-
-    with _approved_symbols_lock:
-        # Double-check after acquiring lock
-        if _approved_symbols_cache is not None:
-            return _approved_symbols_cache
-
-        fs = gcsfs.GCSFileSystem()
-        gcs_path = "open-targets-pre-data-releases/25.09/output/target/"
-        df = pd.read_parquet(gcs_path, filesystem=fs, columns=["approvedSymbol"])
-        approved_symbols = set(df["approvedSymbol"].dropna().astype(str))
-        logger.info("Fetched %d approved symbols from GCS (cached for instance lifetime)", len(approved_symbols))
-        _approved_symbols_cache = approved_symbols
-        return approved_symbols
-
-
-def load_custom_gmt(path):
-    p = Path(path)
-    with p.open("r") as f:
-        return {
-            parts[0]: parts[MIN_GENE_COL_IDX:]
-            for line in f
-            if (parts := line.strip().split("\t")) and len(parts) > MIN_GENE_COL_IDX
-        }
+    Vocabulary codes of stripped input symbols: exact approved symbols, then
+    case-insensitive matches, then synonyms and previous symbols; -1 if unmatched.
 
-
-def available_gmt_files():
+    Returns:
+        Tuple of (codes, counts of input rows matched case-insensitively
+        ('case_remapped_count') and through an alias ('remapped_count'))
     """
-    Return available GMT libraries as:
-    {
-        "Reactome/reactome2022": {"gmt": Path(...), "hierarchy": Path(...)},
-        ...
+    vocabulary = get_symbol_vocabulary()
+    codes = vocabulary.encode(symbols)
+    matched = np.flatnonzero(codes >= 0)
+    case_remapped = vocabulary.symbols[codes[matched]] != symbols.to_numpy(dtype=object)[matched]
+
+    unmatched = np.flatnonzero(codes < 0)
+    alias_codes = vocabulary.encode_aliases(symbols.iloc[unmatched])
+    remapped = alias_codes >= 0
+    codes[unmatched[remapped]] = alias_codes[remapped]
+    return codes, {
+        "case_remapped_count": int(case_remapped.sum()),
+        "remapped_count": int(remapped.sum()),
     }
-    """
-    libraries = {}
-    # Collect all folders first
-    folders = [f for f in GMT_DIR.iterdir() if f.is_dir()]
-    
-    # Sort folders: Reactome first, then others alphabetically
-    def sort_key(folder):
-        if folder.name.startswith("Reactome"):
-            return (0, folder.name)
-        return (1, folder.name)
-    
-    folders.sort(key=sort_key)
-    
-    # Build libraries dictionary in sorted order
-    for folder in folders:
-        gmt_files = list(folder.glob("*.gmt"))
-        txt_files = list(folder.glob("*.txt"))
-        if not gmt_files:
-            continue
-        gmt_file = gmt_files[0]
-        hierarchy_file = txt_files[0] if txt_files else None
-        libraries[f"{folder.name}/{gmt_file.stem}"] = {
-            "gmt": gmt_file,
-            "hierarchy": hierarchy_file,
-        }
-    return libraries
 
 
-def run_gsea_from_dataframe(
-    df: pd.DataFrame, gmt_name: str, processes: int = 4
-) -> tuple[pd.DataFrame, dict]:
+def input_overlap_stats(
+    symbols: pd.Series, codes: np.ndarray, library: CompiledLibrary, gmt_name: str
+) -> tuple[dict, np.ndarray]:
     """
-    Run GSEA using a DataFrame directly (no file required).
-    Results are cached by input hash (genes + gmt_name) to avoid redundant computation.
+    Overlap of the input with the library background.
 
-    Args:
-        df: DataFrame with 'symbol' and 'globalScore' columns, already validated
-        gmt_name: Name of GMT library to use
-        processes: Number of CPU processes
+    used_count / total_input / used_percent keep their original meaning: distinct
+    stripped input symbols found verbatim in the background file. matched_count /
+    matched_percent count the approved background genes reached after symbol
+    matching (see match_symbols), i.e. the genes actually analysed.
 
     Returns:
-        Tuple of (DataFrame with GSEA results, overlap_stats dict)
-
-    Raises:
-        ValueError: If gmt_name is invalid or DataFrame is missing required columns
+        Tuple of (overlap_stats dict, mask over the vocabulary of matched codes)
     """
-    # Check cache before doing any work
-    cache_key = _compute_cache_key(df, gmt_name)
-    with _gsea_cache_lock:
-        if cache_key in _gsea_cache:
-            _gsea_cache.move_to_end(cache_key)
-            logger.info("GSEA cache hit for key %s (library: %s)", cache_key[:12], gmt_name)
-            cached_df, cached_overlap = _gsea_cache[cache_key]
-            return cached_df.copy(), cached_overlap.copy()
-
-    logger.info("GSEA cache miss for key %s (library: %s) — running analysis", cache_key[:12], gmt_name)
-
-    gmt_files = available_gmt_files()
-    if not gmt_name or gmt_name not in gmt_files:
-        msg = "Invalid gmt_name. Choose from: " + str(list(gmt_files.keys()))
-        raise ValueError(msg)
-
-    gmt_file = gmt_files[gmt_name]["gmt"]
-    hierarchy_file = gmt_files[gmt_name]["hierarchy"]
-
-    # load library sets (term -> genes list)
-    library_sets = load_custom_gmt(gmt_file)
-
-    # --- Check if GMT file contains IDs in braces {ID} ---
-    contains_braces = False
-    with gmt_file.open("r") as f:
-        for line in f:
-            if "{" in line and "}" in line:
-                contains_braces = True
-                break
-
-    # Build ID -> genes mapping from the GMT file
-    id_to_genes = {}
-    with gmt_file.open("r") as f:
-        for line in f:
-            parts = line.rstrip("\n").split("\t")
-            if len(parts) > MIN_GENE_COL_IDX:
-                term = parts[0]
-                genes = parts[MIN_GENE_COL_IDX:]
-                if contains_braces and "{" in term and "}" in term:
-                    start = term.find("{") + 1
-                    end = term.find("}", start)
-                    if end > start:
-                        id_ = term[start:end]
-                        id_to_genes[id_] = genes
-                else:
-                    # if no braces, map Term itself as ID
-                    id_to_genes[term] = genes
+    input_unique = np.unique(symbols[symbols != ""].to_numpy(dtype=str)).astype(object)
+    universe = library.universe
+    pos = np.searchsorted(universe, input_unique)
+    found = pos < len(universe)
+    found[found] = universe[pos[found]] == input_unique[found]
+    total_input = len(input_unique)
+    used_count = int(found.sum())
 
-    # Ensure DataFrame is properly formatted
-    if not {"symbol", "globalScore"}.issubset(df.columns):
-        raise ValueError("DataFrame must contain 'symbol' and 'globalScore' columns.")
+    in_vocabulary = np.zeros(len(get_symbol_vocabulary()), dtype=bool)
+    in_vocabulary[codes[codes >= 0]] = True
+    matched_count = int(in_vocabulary[_get_background_codes(library)].sum())
 
-    # Keep only required columns
-    df = df[["symbol", "globalScore"]].copy()
+    def percent(count: int) -> float:
+        return round((count / total_input * 100) if total_input else 0.0, 2)
 
-    # --- Merge background genes for the selected library (no duplicates) ---
-    # Prefer pre-generated background file next to the GMT; fallback to union from GMT
-    background_path = gmt_file.with_name(f"{gmt_file.stem}_background")
-    if background_path.exists():
-        with background_path.open("r") as f:
-            background_genes = {line.strip() for line in f if line.strip()}
-    else:
-        # Fallback: union of all genes from the GMT mapping
-        background_genes = set()
-        for genes in library_sets.values():
-            background_genes.update(g for g in genes if g)
-
-    # --- Calculate missing targets from input list vs library background ---
-    input_symbols = df["symbol"].astype(str).str.strip()
-    input_symbols = input_symbols[input_symbols != ""]
-    input_unique = set(input_symbols)
-    total_input = len(input_unique)
-    overlap_count = len(input_unique & background_genes)
-    overlap_percent = round((overlap_count / total_input * 100) if total_input else 0.0, 2)
     overlap_stats = {
         "library": gmt_name,
-        "used_count": overlap_count,
+        "library_version": library.versioned_name,
+        "used_count": used_count,
         "total_input": total_input,
-        "used_percent": overlap_percent,
+        "used_percent": percent(used_count),
+        "matched_count": matched_count,
+        "matched_percent": percent(matched_count),
     }
+    return overlap_stats, in_vocabulary
 
-    existing_genes = set(df["symbol"].astype(str))
-    missing_genes = sorted(background_genes - existing_genes)
-    if missing_genes:
-        background_df = pd.DataFrame({
-            "symbol": missing_genes,
-            "globalScore": 0,
-        })
-        df = pd.concat([df, background_df], ignore_index=True)
 
-    # --- Filter genes to only include those in Open Targets approved symbols ---
-    approved_symbols = get_approved_symbols_from_gcs()
-    df = df[df["symbol"].astype(str).isin(approved_symbols)].copy()
+def _prepare_signature(
+    df: pd.DataFrame, library: CompiledLibrary, gmt_name: str
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Build the ranked signature passed to blitzgsea in a single pass over the input:
+    symbols are stripped and mapped to approved-symbol codes (see match_symbols),
+    duplicates keep their highest score, the library background is appended at
+    score 0 and everything is ranked by one stable sort on score (ties keep input
+    order, then background genes alphabetically).
+
+    Returns:
+        Tuple of (signature DataFrame with 'symbol' and 'globalScore', overlap_stats dict)
+    """
+    # Ensure DataFrame is properly formatted
+    if not {"symbol", "globalScore"}.issubset(df.columns):
+        raise ValueError("DataFrame must contain 'symbol' and 'globalScore' columns.")
+
+    vocabulary = get_symbol_vocabulary()
+    symbols = df["symbol"].astype(str).str.strip()
+    scores = df["globalScore"].to_numpy(dtype=np.float64)
+    codes, match_counts = match_symbols(symbols)
+
+    # --- Overlap of input list with library background ---
+    overlap_stats, in_vocabulary = input_overlap_stats(symbols, codes, library, gmt_name)
+    overlap_stats.update(match_counts)
+    background_codes = _get_background_codes(library)
+
+    # --- Approved symbols only; duplicates keep the highest score ---
+    rows = np.flatnonzero(codes >= 0)
+    by_code = rows[np.lexsort((-scores[rows], codes[rows]))]
+    first = np.ones(len(by_code), dtype=bool)
+    first[1:] = codes[by_code[1:]] != codes[by_code[:-1]]
+    rows = np.sort(by_code[first])  # back to input order
+
+    # --- Pad with background genes missing from the input, at score 0 ---
+    padding = background_codes[~in_vocabulary[background_codes]]
+    all_codes = np.concatenate([codes[rows], padding])
+    all_scores = np.concatenate([scores[rows], np.zeros(len(padding))])
+
+    rank = np.argsort(-all_scores, kind="stable")
+    signature = pd.DataFrame({
+        "symbol": vocabulary.symbols[all_codes[rank]],
+        "globalScore": all_scores[rank],
+    })
+    return signature, overlap_stats
 
-    # Sort by score desc and drop duplicate symbols keeping highest score (originals win over zeros)
-    df = df.sort_values("globalScore", ascending=False)
-    df = df.drop_duplicates(subset=["symbol"], keep="first")
 
-    res_df = blitz.gsea(df, library_sets, processes=processes).reset_index(names="Term")
+def _term_annotations(library: CompiledLibrary) -> tuple[pd.Index, dict[str, np.ndarray]]:
+    """
+    Terms of a library with their ID, display name, link, size, genes and parents,
+    as one array per column. Built once per library version, so results only take
+    rows from it.
+    """
+    annotations = library.derived.get("term_annotations")
+    if annotations is not None:
+        return annotations
 
+    terms = pd.Series(list(library.library_sets), dtype=object)
     # --- Extract IDs and clean terms ---
-    if contains_braces:
-        term_series = res_df["Term"]
-        res_df["ID"] = term_series.str.extract(r"\{([^}]+)\}", expand=False).fillna("")
-        res_df["Term"] = term_series.str.replace(
-            r"\s*\{[^}]+\}", "", regex=True
-        ).str.strip()
+    if library.contains_braces:
+        ids = terms.str.extract(r"\{([^}]+)\}", expand=False).fillna("")
+        names = terms.str.replace(r"\s*\{[^}]+\}", "", regex=True).str.strip()
     else:
-        res_df["ID"] = res_df["Term"]  # use Term as ID directly
-
-    if "leading_edge" in res_df.columns:
-        res_df["leading_edge"] = res_df["leading_edge"].apply(
-            lambda x: ",".join(x) if isinstance(x, (list, tuple)) else str(x)
-        )
+        ids = names = terms  # use Term as ID directly
 
     # --- Dynamic link assignment ---
-    if gmt_file.stem.startswith("GO"):
-        res_df["Link"] = "https://www.ebi.ac.uk/QuickGO/term/" + res_df["ID"]
-    elif gmt_file.stem.startswith("Reactome"):
-        res_df["Link"] = "https://reactome.org/content/detail/" + res_df["ID"]
+    stem = library.gmt_file.stem
+    if stem.startswith("GO"):
+        links = "https://www.ebi.ac.uk/QuickGO/term/" + ids
+    elif stem.startswith("Reactome"):
+        links = "https://reactome.org/content/detail/" + ids
     else:
-        res_df["Link"] = "https://www.ebi.ac.uk/chembl/visualise"
+        links = pd.Series("https://www.ebi.ac.uk/chembl/visualise", index=ids.index)
 
     # --- Size and full gene list from GMT ---
-    res_df["Pathway size"] = res_df["ID"].map(
-        lambda x: len(id_to_genes.get(x, [])) if pd.notna(x) and x != "" else 0
-    )
-    res_df["Pathway genes"] = res_df["ID"].map(
-        lambda x: ",".join(id_to_genes.get(x, [])) if pd.notna(x) and x != "" else ""
-    )
+    id_to_genes = library.id_to_genes
+    term_genes = [id_to_genes.get(x, []) if x else [] for x in ids]
+
+    # --- Parent pathways from the precompiled hierarchy index ---
+    parents = library.parents or {}
+
+    columns = {
+        "ID": ids.to_numpy(dtype=object),
+        "Link": links.to_numpy(dtype=object),
+        "Pathway": names.to_numpy(dtype=object),
+        "Pathway size": np.array([len(genes) for genes in term_genes], dtype=int),
+        "Pathway genes": np.array([",".join(genes) for genes in term_genes], dtype=object),
+        "Parent pathway": np.array([parents.get(x, "") for x in ids], dtype=object),
+    }
+    annotations = library.derived["term_annotations"] = (pd.Index(terms), columns)
+    return annotations
+
+
+def _finite(values: pd.Series, default: float) -> np.ndarray:
+    """Float values with NaN and infinities replaced, for JSON serialization."""
+    values = values.to_numpy(dtype=float)
+    return np.where(np.isfinite(values), values, default)
+
+
+def annotate_results(
+    res_df: pd.DataFrame, library: CompiledLibrary, keep_order: bool = False
+) -> pd.DataFrame:
+    """
+    Turn raw engine output indexed by term (blitzgsea columns es, nes, pval, sidak,
+    fdr, geneset_size, leading_edge) into the API result table.
 
+    Columns are taken whole from the raw output and the library's term table
+    (see _term_annotations); nothing is computed per row except leading edges.
+
+    Args:
+        res_df: Raw engine output
+        library: Library the terms come from
+        keep_order: Keep the row order of res_df; otherwise rows of libraries with
+            a hierarchy are ordered by ID
+    """
+    terms, table = _term_annotations(library)
+    positions = terms.get_indexer(res_df.index)
+    missing = positions < 0
+    annotations = {name: values[positions] for name, values in table.items()}
+    if missing.any():
+        # Terms outside the library get empty annotations
+        for name in ("ID", "Link", "Pathway genes", "Parent pathway"):
+            annotations[name][missing] = ""
+        annotations["Pathway size"][missing] = 0
+        annotations["Pathway"][missing] = res_df.index[missing]
+
+    defaults = {"es": 0.0, "nes": 0.0, "fdr": 1.0, "pval": 1.0, "sidak": 1.0}
     rename_map = {
-        "Term": "Pathway",
         "es": "ES",
         "nes": "NES",
         "fdr": "FDR",
@@ -262,81 +304,273 @@ def run_gsea_from_dataframe(
         "geneset_size": "Number of input genes",
         "leading_edge": "Leading edge genes",
     }
-    res_df = res_df.rename(columns=rename_map)
+    columns = {"Pathway": annotations["Pathway"]}
+    for raw_name in res_df.columns:
+        values = res_df[raw_name]
+        if raw_name in defaults:
+            values = _finite(values, defaults[raw_name])
+        elif raw_name == "geneset_size":
+            values = pd.to_numeric(values, errors="coerce").fillna(0).to_numpy(dtype=int)
+        elif raw_name == "leading_edge":
+            values = np.array(
+                [
+                    ",".join(x) if isinstance(x, (list, tuple)) else "" if pd.isna(x) else str(x)
+                    for x in values
+                ],
+                dtype=object,
+            )
+        else:
+            values = values.to_numpy()
+        columns[rename_map.get(raw_name, raw_name)] = values
+    for name in ("ID", "Link", "Pathway size", "Pathway genes", "Parent pathway"):
+        columns[name] = annotations[name]
+
+    if library.parents is not None:
+        # Same column and row order as grouping by term, as before the index was precompiled
+        columns = {
+            name: columns[name]
+            for name in (
+                "ID", "Link", "Pathway", "ES", "NES", "FDR", "p-value",
+                "Sidak's p-value", "Number of input genes", "Leading edge genes",
+                "Pathway size", "Pathway genes", "Parent pathway",
+            )
+        }
+        if not keep_order:
+            order = np.argsort(columns["ID"], kind="stable")
+            columns = {name: values[order] for name, values in columns.items()}
+
+    return pd.DataFrame(columns)
+
+
+def permutation_options(pvalue_method: PValueMethod, n_perm: int, seed: int) -> dict | None:
+    """Cache key options of a p-value method; None for the default gamma method."""
+    if pvalue_method == "gamma":
+        return None
+    return {"pvalue_method": pvalue_method, "n_perm": n_perm, "seed": seed}
+
+
+def _run_engine(
+    signature: pd.DataFrame,
+    library: CompiledLibrary,
+    processes: int | None,
+    pvalue_method: PValueMethod = "gamma",
+    n_perm: int = 1000,
+    seed: int = 0,
+    keep_null_model: bool = True,
+) -> pd.DataFrame:
+    if processes is None:
+        with get_cpu_scheduler().slot() as processes:
+            return _run_engine(
+                signature, library, processes, pvalue_method, n_perm, seed, keep_null_model
+            )
+    if pvalue_method == "permutation":
+        return permutation_gsea(
+            signature, library.library_sets, n_perm=n_perm, seed=seed, processes=processes
+        )
+    if processes == 1:
+        # blitzgsea's own single-process estimate is broken (see estimate_null_model);
+        # estimating it here makes gsea() take the model from its cache instead
+        cached_null_model(signature, library.library_sets)
+    raw_df = blitz.gsea(signature, library.library_sets, processes=processes)
+    if not keep_null_model:
+        discard_null_model(signature)
+    return raw_df
+
+
+def _store_result(
+    cache_key: str,
+    gmt_name: str,
+    signature: pd.DataFrame,
+    raw_df: pd.DataFrame,
+    res_df: pd.DataFrame,
+    overlap_stats: dict,
+    null_model: tuple | None = None,
+    keep_state: bool = True,
+) -> None:
+    _gsea_cache.put(
+        cache_key,
+        (res_df.copy(), overlap_stats.copy()),
+        estimate_result_size(res_df, overlap_stats),
+    )
+    if not keep_state:
+        return
+    # Keep what a later delta request needs to re-rank against this result
+    state = EngineState(gmt_name, signature, raw_df, null_model)
+    _engine_states.put(cache_key, state, state.size_bytes())
+
+
+def run_gsea_from_dataframe(
+    df: pd.DataFrame,
+    gmt_name: str,
+    processes: int | None = None,
+    pvalue_method: PValueMethod = "gamma",
+    n_perm: int = 1000,
+    seed: int = 0,
+    use_cache: bool = True,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Run GSEA using a DataFrame directly (no file required).
+    Same as run_gsea_keyed() without the cache key.
+
+    With use_cache=False nothing is read from or kept in the result cache, the
+    delta re-ranking state or blitzgsea's null model cache; for batch jobs whose
+    inputs are never requested again.
 
-    # --- Load hierarchy mapping if available ---
-    if hierarchy_file and hierarchy_file.exists():
-        hierarchy_df = pd.read_csv(
-            hierarchy_file, sep="\t", header=None,
-            names=["Parent pathway", "Child pathway"],
+    Returns:
+        Tuple of (DataFrame with GSEA results, overlap_stats dict)
+    """
+    if use_cache:
+        res_df, overlap_stats, _ = run_gsea_keyed(
+            df, gmt_name, processes, pvalue_method, n_perm, seed
         )
-        res_df = res_df.merge(
-            hierarchy_df, left_on="ID", right_on="Child pathway", how="left"
+        return res_df, overlap_stats
+
+    with library_lease(gmt_name) as library:
+        signature, overlap_stats = _prepare_signature(df, library, gmt_name)
+        raw_df = _run_engine(
+            signature, library, processes, pvalue_method, n_perm, seed, keep_null_model=False
         )
-        res_df = (
-            res_df.groupby(
-                [
-                    "ID", "Link", "Pathway", "ES", "NES", "FDR", "p-value",
-                    "Sidak's p-value", "Number of input genes", "Leading edge genes",
-                    "Pathway size", "Pathway genes",
-                ],
-                dropna=False,
-            )["Parent pathway"]
-            .apply(lambda x: ",".join(sorted(set(x.dropna()))))
-            .reset_index()
+        return annotate_results(raw_df, library), overlap_stats
+
+
+def run_gsea_keyed(
+    df: pd.DataFrame,
+    gmt_name: str,
+    processes: int | None = None,
+    pvalue_method: PValueMethod = "gamma",
+    n_perm: int = 1000,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, dict, str]:
+    """
+    Run GSEA using a DataFrame directly (no file required).
+    Results are cached by input hash (genes + library version) to avoid redundant computation.
+
+    Args:
+        df: DataFrame with 'symbol' and 'globalScore' columns, already validated
+        gmt_name: Name of GMT library to use
+        processes: Number of CPU processes. If None, a share of the CPU budget is
+            assigned by the scheduler based on concurrent jobs.
+        pvalue_method: 'gamma' for blitzgsea's fitted null, 'permutation' for
+            p-values from n_perm random gene sets per set size (see
+            permutation_gsea for the p-value and NES definitions)
+        n_perm: Number of permutations (permutation method only)
+        seed: Random seed; permutation results depend only on the seed, not on
+            the number of processes
+
+    Returns:
+        Tuple of (DataFrame with GSEA results, overlap_stats dict, cache_key)
+
+    Raises:
+        ValueError: If gmt_name is invalid or DataFrame is missing required columns
+    """
+    options = permutation_options(pvalue_method, n_perm, seed)
+    # Hold the current library version for the whole run, even if it is reloaded meanwhile
+    with library_lease(gmt_name) as library:
+        # Check cache before doing any work
+        cache_key = compute_cache_key(df, library.versioned_name, options=options)
+        cached = _gsea_cache.get(cache_key)
+        if cached is not None:
+            logger.info("GSEA cache hit for key %s (library: %s)", cache_key[:12], library.versioned_name)
+            cached_df, cached_overlap = cached
+            return cached_df.copy(), cached_overlap.copy(), cache_key
+
+        logger.info(
+            "GSEA cache miss for key %s (library: %s) — running analysis",
+            cache_key[:12], library.versioned_name,
         )
-    else:
-        res_df["Parent pathway"] = ""
-
-    # --- Final: ensure integer formatting for counts (no .0) ---
-    def safe_int_col(df_, col_name):
-        """
-        Clean a column (remove commas, coerce non-numeric → NaN), fill NaN with 0, then convert to int.
-        """
-        if col_name in df_.columns:
-            s = df_[col_name].astype(str).str.replace(",", "", regex=False).str.strip()
-            s = s.replace({"": None, "nan": None})
-            df_[col_name] = pd.to_numeric(s, errors="coerce").fillna(0).astype(int)
-
-    safe_int_col(res_df, "Number of input genes")
-    safe_int_col(res_df, "Pathway size")
-
-    # Handle NaN values for JSON serialization
-    res_df = res_df.replace([np.inf, -np.inf], np.nan)
-    res_df = res_df.fillna({
-        'ES': 0.0,
-        'NES': 0.0,
-        'FDR': 1.0,
-        'p-value': 1.0,
-        "Sidak's p-value": 1.0,
-        'Number of input genes': 0,
-        'Pathway size': 0
-    })
 
-    # Ensure string columns are properly handled
-    string_columns = ['Leading edge genes', 'Pathway genes', 'Parent pathway']
-    for col in string_columns:
-        if col in res_df.columns:
-            res_df[col] = res_df[col].astype(str).replace('nan', '')
+        signature, overlap_stats = _prepare_signature(df, library, gmt_name)
+        raw_df = _run_engine(signature, library, processes, pvalue_method, n_perm, seed)
+        res_df = annotate_results(raw_df, library)
 
+        # Delta re-ranking reuses the gamma null model, so only gamma runs can be a base
+        _store_result(
+            cache_key, library.versioned_name, signature, raw_df, res_df, overlap_stats,
+            keep_state=options is None,
+        )
+    return res_df, overlap_stats, cache_key
 
-    # Store in cache
-    with _gsea_cache_lock:
-        _gsea_cache[cache_key] = (res_df.copy(), overlap_stats.copy())
-        if len(_gsea_cache) > _GSEA_CACHE_MAX_SIZE:
-            _gsea_cache.popitem(last=False)
 
-    return res_df, overlap_stats
+def run_gsea_delta(
+    df: pd.DataFrame, gmt_name: str, base_key: str, processes: int | None = None
+) -> tuple[pd.DataFrame, dict, dict]:
+    """
+    Run GSEA for a ranked list that differs from an earlier request only in a few
+    scores, recomputing enrichment only for gene sets that contain a changed gene.
+
+    Gene sets without changed genes keep the base result, and the base signature's
+    null model is reused for p-values, so results are approximate: rank shifts of
+    unchanged genes and the shifted signature mean are ignored for those sets. When
+    the base result is no longer cached, belongs to another library, or too many
+    genes changed (GSEA_DELTA_MAX_MOVED_GENES), a full analysis is run instead.
+
+    Args:
+        df: DataFrame with 'symbol' and 'globalScore' columns, already validated
+        gmt_name: Name of GMT library to use
+        base_key: cache_key returned for the earlier request
+        processes: Number of CPU processes for a full run (None lets the scheduler decide)
+
+    Returns:
+        Tuple of (DataFrame with GSEA results, overlap_stats dict, delta_stats dict)
+
+    Raises:
+        ValueError: If gmt_name is invalid or DataFrame is missing required columns
+    """
+    with library_lease(gmt_name) as library:
+        cache_key = compute_cache_key(df, library.versioned_name, base_key=base_key)
+        delta_stats = {"base_key": base_key, "cache_key": cache_key}
+
+        cached = _gsea_cache.get(cache_key)
+        if cached is not None:
+            logger.info(
+                "GSEA delta cache hit for key %s (library: %s)", cache_key[:12], library.versioned_name
+            )
+            cached_df, cached_overlap = cached
+            return cached_df.copy(), cached_overlap.copy(), {**delta_stats, "mode": "cached"}
+
+        signature, overlap_stats = _prepare_signature(df, library, gmt_name)
+
+        base = _engine_states.get(base_key)
+        reranked = None
+        if base is None:
+            reason = "base result not cached"
+        elif base.gmt_name != library.versioned_name:
+            reason = "base result is for another library or library version"
+        else:
+            reranked = rerank(
+                base, signature, library.library_sets, library.gene_to_terms,
+                max_moved=get_config().GSEA_DELTA_MAX_MOVED_GENES,
+            )
+            reason = "too many changed genes"
+
+        if reranked is not None:
+            raw_df, null_model, rerank_stats = reranked
+            logger.info(
+                "GSEA delta for key %s: %d changed genes, %d gene sets recomputed",
+                cache_key[:12], rerank_stats["moved_genes"], rerank_stats["recomputed_sets"],
+            )
+            res_df = annotate_results(raw_df, library)
+            _store_result(
+                cache_key, library.versioned_name, signature, raw_df, res_df, overlap_stats, null_model
+            )
+            return res_df, overlap_stats, {**delta_stats, "mode": "delta", **rerank_stats}
+
+    logger.info("GSEA delta for key %s falls back to a full run: %s", cache_key[:12], reason)
+    # A full run is exact, so store it under the plain key as well
+    res_df, overlap_stats, full_key = run_gsea_keyed(df, gmt_name, processes)
+    return res_df, overlap_stats, {
+        **delta_stats, "cache_key": full_key, "mode": "full", "reason": reason,
+    }
 
 
-def run_gsea(input_tsv=None, gmt_name=None, processes=4):
+def run_gsea(input_tsv=None, gmt_name=None, processes=None):
     """
     Run GSEA from a TSV file path (backward compatible).
 
     Args:
         input_tsv: Path to TSV file with 'symbol' and 'globalScore' columns
         gmt_name: Name of GMT library to use
-        processes: Number of CPU processes
+        processes: Number of CPU processes (None lets the scheduler decide)
 
     Returns:
         Tuple of (DataFrame with GSEA results, overlap_stats dict)
@@ -0,0 +1,489 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.config import get_config
+from app.scripts.prepare_gene_lists import generate_background_for_gmt
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # app/
+DATA_DIR = BASE_DIR / "data"
+GMT_DIR = DATA_DIR / "gmt"
+MIN_GENE_COL_IDX = 2
+# Gene set sizes analysed (blitzgsea.gsea() defaults), shared by GSEA, delta and ORA
+MIN_SET_SIZE = 5
+MAX_SET_SIZE = 4000
+# Hex digits of the content hash used as library version
+VERSION_LENGTH = 12
+
+
+@dataclass(frozen=True)
+class CompiledLibrary:
+    """Parsed GMT library plus the lookups needed to annotate GSEA results."""
+
+    name: str
+    version: str  # content hash, see content_version()
+    gmt_file: Path
+    hierarchy_file: Path | None
+    library_sets: dict[str, list[str]]  # term -> genes
+    id_to_genes: dict[str, list[str]]  # term ID -> genes
+    contains_braces: bool  # terms carry their ID as 'Name{ID}'
+    background_genes: frozenset[str]
+    parents: dict[str, str] | None  # term ID -> comma-joined sorted parent IDs
+    gene_to_terms: dict[str, tuple[str, ...]]  # gene -> terms containing it
+    # Term x gene membership over the background in CSR layout: the genes of term
+    # set_names[i] are universe[set_indices[set_indptr[i]:set_indptr[i + 1]]]
+    universe: np.ndarray  # sorted background genes
+    set_names: tuple[str, ...]
+    set_indptr: np.ndarray
+    set_indices: np.ndarray
+    # Per-process lookups derived from this version (e.g. vocabulary codes), freed with it
+    derived: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def versioned_name(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+
+def load_custom_gmt(path):
+    p = Path(path)
+    with p.open("r") as f:
+        return {
+            parts[0]: parts[MIN_GENE_COL_IDX:]
+            for line in f
+            if (parts := line.strip().split("\t")) and len(parts) > MIN_GENE_COL_IDX
+        }
+
+
+def _scan_gmt_dir(gmt_dir: Path) -> dict[str, tuple[Path, Path | None]]:
+    """Library name -> (GMT file, hierarchy file) for each library folder, Reactome first."""
+    libraries = {}
+    if not gmt_dir.is_dir():
+        return libraries
+    # Collect all folders first
+    folders = [f for f in gmt_dir.iterdir() if f.is_dir()]
+
+    # Sort folders: Reactome first, then others alphabetically
+    def sort_key(folder):
+        if folder.name.startswith("Reactome"):
+            return (0, folder.name)
+        return (1, folder.name)
+
+    folders.sort(key=sort_key)
+
+    # Build libraries dictionary in sorted order
+    for folder in folders:
+        gmt_files = sorted(folder.glob("*.gmt"))
+        txt_files = sorted(folder.glob("*.txt"))
+        if not gmt_files:
+            continue
+        gmt_file = gmt_files[0]
+        hierarchy_file = txt_files[0] if txt_files else None
+        libraries[f"{folder.name}/{gmt_file.stem}"] = (gmt_file, hierarchy_file)
+    return libraries
+
+
+def content_version(gmt_file: Path, hierarchy_file: Path | None) -> str:
+    """
+    Version of a library derived from the bytes of its files, so every worker process
+    and every restart gives the same files the same version.
+    """
+    h = hashlib.sha256()
+    for path in (gmt_file, hierarchy_file):
+        if path is not None:
+            h.update(path.read_bytes())
+        h.update(b"\x00")
+    return h.hexdigest()[:VERSION_LENGTH]
+
+
+def _fingerprint(*paths: Path | None) -> tuple:
+    """(path, mtime, size) of each file; changes whenever a file is replaced or edited."""
+    result = []
+    for path in paths:
+        if path is None:
+            result.append(None)
+            continue
+        st = path.stat()
+        result.append((str(path), st.st_mtime_ns, st.st_size))
+    return tuple(result)
+
+
+def compile_library(
+    name: str, gmt_file: Path, hierarchy_file: Path | None, version: str | None = None
+) -> CompiledLibrary:
+    """
+    Parse a GMT library, its background gene list and hierarchy into a CompiledLibrary.
+
+    A missing or outdated background file is regenerated from the GMT first. The
+    version defaults to the content hash of the files.
+    """
+    if version is None:
+        version = content_version(gmt_file, hierarchy_file)
+    # load library sets (term -> genes list)
+    library_sets = load_custom_gmt(gmt_file)
+
+    # --- Check if GMT file contains IDs in braces {ID} ---
+    contains_braces = False
+    with gmt_file.open("r") as f:
+        for line in f:
+            if "{" in line and "}" in line:
+                contains_braces = True
+                break
+
+    # Build ID -> genes mapping from the GMT file
+    id_to_genes = {}
+    with gmt_file.open("r") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) > MIN_GENE_COL_IDX:
+                term = parts[0]
+                genes = parts[MIN_GENE_COL_IDX:]
+                if contains_braces and "{" in term and "}" in term:
+                    start = term.find("{") + 1
+                    end = term.find("}", start)
+                    if end > start:
+                        id_ = term[start:end]
+                        id_to_genes[id_] = genes
+                else:
+                    # if no braces, map Term itself as ID
+                    id_to_genes[term] = genes
+
+    # Background gene list next to the GMT, regenerated when the GMT is newer (hot reload)
+    background_path = gmt_file.with_name(f"{gmt_file.stem}_background")
+    try:
+        if generate_background_for_gmt(gmt_file) is not None:
+            logger.info("Regenerated background gene list %s", background_path)
+        with background_path.open("r") as f:
+            background_genes = {line.strip() for line in f if line.strip()}
+    except OSError as exc:
+        # e.g. read-only data directory: build the same list in memory
+        logger.warning("Cannot regenerate %s (%s); using the GMT genes", background_path, exc)
+        background_genes = set()
+        for genes in library_sets.values():
+            background_genes.update(g.strip() for g in genes if g.strip())
+
+    # --- Child -> parents index from the hierarchy file ---
+    parents = None
+    if hierarchy_file and hierarchy_file.exists():
+        hierarchy_df = pd.read_csv(
+            hierarchy_file, sep="\t", header=None,
+            names=["Parent pathway", "Child pathway"],
+        )
+        parents = (
+            hierarchy_df.dropna()
+            .groupby("Child pathway")["Parent pathway"]
+            .apply(lambda x: ",".join(sorted(set(x.astype(str)))))
+            .to_dict()
+        )
+
+    # --- Gene -> terms index, used to find the sets touched by changed genes ---
+    gene_to_terms: dict[str, list[str]] = {}
+    for term, genes in library_sets.items():
+        for gene in set(genes):
+            gene_to_terms.setdefault(gene, []).append(term)
+
+    # --- Term x gene membership matrix over the sorted background ---
+    universe = np.array(sorted(background_genes), dtype=object)
+    gene_pos = {gene: i for i, gene in enumerate(universe)}
+    members = [
+        sorted({gene_pos[g] for g in genes if g in gene_pos}) for genes in library_sets.values()
+    ]
+    set_indptr = np.zeros(len(members) + 1, dtype=np.int64)
+    set_indptr[1:] = np.cumsum([len(m) for m in members])
+    set_indices = np.fromiter(
+        itertools.chain.from_iterable(members), dtype=np.int64, count=int(set_indptr[-1])
+    )
+
+    return CompiledLibrary(
+        name=name,
+        version=version,
+        gmt_file=gmt_file,
+        hierarchy_file=hierarchy_file,
+        library_sets=library_sets,
+        id_to_genes=id_to_genes,
+        contains_braces=contains_braces,
+        background_genes=frozenset(background_genes),
+        parents=parents,
+        gene_to_terms={gene: tuple(terms) for gene, terms in gene_to_terms.items()},
+        universe=universe,
+        set_names=tuple(library_sets),
+        set_indptr=set_indptr,
+        set_indices=set_indices,
+    )
+
+
+@dataclass(frozen=True)
+class CatalogueEntry:
+    """Current version of a library folder; replaced (never mutated) when files change."""
+
+    name: str
+    version: str
+    gmt_file: Path
+    hierarchy_file: Path | None
+    fingerprint: tuple  # cheap change detection; the version is only rehashed on change
+
+    @property
+    def versioned_name(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+
+class LibraryCatalogue:
+    """
+    Versioned GMT libraries of a data directory.
+
+    The directory is scanned at construction and by refresh(); libraries are compiled
+    on first use, or by refresh() itself when a folder is added or its files change.
+    Versions are content hashes ('Reactome/ReactomePathways_2025@v3f1c0a9e52b7'), so
+    all worker processes agree on them. A changed library is swapped in atomically
+    once compiled, so requests never wait for a reload.
+    Superseded versions stay loaded while jobs hold a lease on them and can still be
+    requested by versioned name until then.
+    """
+
+    def __init__(self, gmt_dir: Path):
+        self.gmt_dir = Path(gmt_dir)
+        self._entries: dict[str, CatalogueEntry] = {}  # swapped as a whole
+        self._compiled: dict[str, CompiledLibrary] = {}  # versioned name -> library
+        self._leases: dict[str, int] = {}
+        self._retired: set[str] = set()
+        self._lock = threading.Lock()
+        self._compile_lock = threading.Lock()
+        self.refresh(compile_changed=False)
+
+    def available(self) -> dict[str, CatalogueEntry]:
+        """Current entries by library name, from the last scan (no filesystem access)."""
+        return self._entries
+
+    def refresh(self, compile_changed: bool = True) -> list[str]:
+        """
+        Rescan the directory. New and changed libraries get a new version, compiled
+        before they are published when compile_changed is set.
+
+        Returns:
+            Names of libraries that were added or updated
+        """
+        current = self._entries
+        entries: dict[str, CatalogueEntry] = {}
+        changed: list[str] = []
+        for name, (gmt_file, hierarchy_file) in _scan_gmt_dir(self.gmt_dir).items():
+            try:
+                fingerprint = _fingerprint(gmt_file, hierarchy_file)
+            except OSError:  # file replaced while scanning; pick it up next time
+                if name in current:
+                    entries[name] = current[name]
+                continue
+            old = current.get(name)
+            if old is not None and old.fingerprint == fingerprint:
+                entries[name] = old
+                continue
+            try:
+                version = content_version(gmt_file, hierarchy_file)
+            except OSError:
+                if old is not None:
+                    entries[name] = old
+                continue
+            if old is not None and old.version == version:
+                # Touched or rewritten with the same content
+                entries[name] = replace(old, fingerprint=fingerprint)
+                continue
+
+            entry = CatalogueEntry(name, version, gmt_file, hierarchy_file, fingerprint)
+            if compile_changed:
+                try:
+                    library = compile_library(name, gmt_file, hierarchy_file, version)
+                except Exception as exc:  # noqa: BLE001
+                    # Keep serving the previous version until the files are fixed
+                    logger.warning("Failed to compile library %s: %s", entry.versioned_name, exc)
+                    if old is not None:
+                        entries[name] = old
+                    continue
+                with self._lock:
+                    self._compiled[entry.versioned_name] = library
+            entries[name] = entry
+            changed.append(name)
+
+        with self._lock:
+            self._entries = entries
+            for name, old in current.items():
+                new = entries.get(name)
+                if new is None or new.versioned_name != old.versioned_name:
+                    self._retire(old.versioned_name)
+        return changed
+
+    def _retire(self, versioned_name: str) -> None:
+        # Caller holds self._lock
+        if self._leases.get(versioned_name):
+            self._retired.add(versioned_name)
+        else:
+            self._compiled.pop(versioned_name, None)
+
+    def get(self, gmt_name: str) -> CompiledLibrary:
+        """
+        Return the current version of a library, or a specific one ('name@v<hash>') while
+        it is still loaded, compiling it on first use.
+
+        Raises:
+            ValueError: If gmt_name is not an available library or version
+        """
+        return self._acquire(gmt_name, lease=False)
+
+    @contextmanager
+    def lease(self, gmt_name: str):
+        """Context manager yielding a library that stays loaded until the block exits."""
+        library = self._acquire(gmt_name, lease=True)
+        key = library.versioned_name
+        try:
+            yield library
+        finally:
+            with self._lock:
+                self._leases[key] -= 1
+                if not self._leases[key]:
+                    del self._leases[key]
+                    if key in self._retired:
+                        self._retired.discard(key)
+                        self._compiled.pop(key, None)
+
+    def _acquire(self, gmt_name: str, lease: bool) -> CompiledLibrary:
+        # The lease is taken under the same lock as the lookup, so a concurrent
+        # refresh() cannot retire the version in between
+        name, _, version = gmt_name.partition("@v") if gmt_name else ("", "", "")
+        with self._lock:
+            entry = self._entries.get(name)
+            if version:
+                library = self._compiled.get(gmt_name)
+                if library is None and (entry is None or entry.versioned_name != gmt_name):
+                    current = entry.versioned_name if entry else None
+                    raise ValueError(
+                        f"Library version {gmt_name} is not available (current: {current})"
+                    )
+            elif entry is None:
+                msg = "Invalid gmt_name. Choose from: " + str(list(self._entries.keys()))
+                raise ValueError(msg)
+            else:
+                library = self._compiled.get(entry.versioned_name)
+            if library is not None:
+                return self._hold(library, lease)
+
+        with self._compile_lock:
+            with self._lock:
+                library = self._compiled.get(entry.versioned_name)
+                if library is not None:
+                    return self._hold(library, lease)
+            library = compile_library(
+                entry.name, entry.gmt_file, entry.hierarchy_file, entry.version
+            )
+            with self._lock:
+                # Do not resurrect a version superseded while it was compiling
+                current = self._entries.get(entry.name)
+                if current is not None and current.versioned_name == entry.versioned_name:
+                    self._compiled[entry.versioned_name] = library
+                self._hold(library, lease)
+            logger.info(
+                "Compiled library %s (%d gene sets)", entry.versioned_name, len(library.library_sets)
+            )
+            return library
+
+    def _hold(self, library: CompiledLibrary, lease: bool) -> CompiledLibrary:
+        # Caller holds self._lock
+        if lease:
+            key = library.versioned_name
+            self._leases[key] = self._leases.get(key, 0) + 1
+        return library
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "libraries": {name: e.versioned_name for name, e in self._entries.items()},
+                "loaded": sorted(self._compiled),
+                "leases": dict(self._leases),
+            }
+
+
+# --- Catalogue singleton and watcher ---
+_catalogue: LibraryCatalogue | None = None
+_catalogue_lock = threading.Lock()
+_watcher: threading.Thread | None = None
+
+
+def get_library_catalogue() -> LibraryCatalogue:
+    """Return the process-wide catalogue of app/data/gmt."""
+    global _catalogue
+    if _catalogue is not None:
+        return _catalogue
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = LibraryCatalogue(GMT_DIR)
+        return _catalogue
+
+
+def start_library_watcher(interval: float | None = None) -> threading.Thread | None:
+    """
+    Start a daemon thread that refreshes the catalogue every `interval` seconds
+    (GMT_RELOAD_INTERVAL by default; 0 disables). Threads do not survive fork, so
+    each worker process starts its own.
+    """
+    global _watcher
+    interval = get_config().GMT_RELOAD_INTERVAL if interval is None else interval
+    if interval <= 0 or _watcher is not None:
+        return _watcher
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                changed = get_library_catalogue().refresh()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Library catalogue refresh failed: %s", exc)
+                continue
+            if changed:
+                logger.info("Reloaded libraries: %s", get_library_catalogue().stats()["libraries"])
+
+    _watcher = threading.Thread(target=watch, name="gmt-catalogue-watcher", daemon=True)
+    _watcher.start()
+    return _watcher
+
+
+def available_gmt_files():
+    """
+    Return available GMT libraries as:
+    {
+        "Reactome/reactome2022": {"gmt": Path(...), "hierarchy": Path(...), "version": "3f1c0a9e52b7"},
+        ...
+    }
+    """
+    return {
+        name: {"gmt": e.gmt_file, "hierarchy": e.hierarchy_file, "version": e.version}
+        for name, e in get_library_catalogue().available().items()
+    }
+
+
+def get_library(gmt_name: str) -> CompiledLibrary:
+    """
+    Return the compiled library for gmt_name ('name' or 'name@v<hash>').
+
+    Raises:
+        ValueError: If gmt_name is not an available library
+    """
+    return get_library_catalogue().get(gmt_name)
+
+
+def library_lease(gmt_name: str):
+    """Context manager yielding the compiled library, kept loaded until the block exits."""
+    return get_library_catalogue().lease(gmt_name)
+
+
+def preload_libraries() -> list[str]:
+    """Compile every available library. Returns the library names."""
+    names = list(available_gmt_files().keys())
+    for name in names:
+        get_library(name)
+    return names
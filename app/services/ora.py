@@ -0,0 +1,196 @@
+from typing import Iterable
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+from statsmodels.stats.multitest import multipletests
+
+from app.services.gsea import annotate_results, input_overlap_stats, match_symbols
+from app.services.library import CompiledLibrary, available_gmt_files, get_library
+from app.services.library import MAX_SET_SIZE, MIN_SET_SIZE
+from app.services.symbols import get_symbol_vocabulary
+
+logger = logging.getLogger(__name__)
+
+
+def _log_binom(n: np.ndarray, k: np.ndarray) -> np.ndarray:
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def hypergeom_upper_tail(k: np.ndarray, n_universe: int, n: np.ndarray, n_draws: int) -> np.ndarray:
+    """
+    P(X >= k) for X ~ Hypergeom(n_universe, n, n_draws), vectorized over (k, n).
+
+    Sums the pmf over every tail in one flat array in log space; scipy's
+    hypergeom.sf evaluates each element separately and is ~100x slower here.
+    """
+    k = np.asarray(k, dtype=np.int64)
+    n = np.asarray(n, dtype=np.int64)
+    upper = np.minimum(n, n_draws)
+    lengths = np.maximum(upper - k + 1, 0)
+    pvals = np.zeros(len(k))
+    nonempty = np.flatnonzero(lengths)
+    if len(nonempty) == 0:
+        return pvals
+
+    # x runs over k..upper of each tail, tails laid out back to back
+    lengths = lengths[nonempty]
+    starts = np.zeros(len(nonempty), dtype=np.int64)
+    starts[1:] = np.cumsum(lengths)[:-1]
+    tail = np.repeat(np.arange(len(nonempty)), lengths)
+    x = k[nonempty][tail] + np.arange(len(tail)) - starts[tail]
+    n_tail = n[nonempty][tail]
+    log_pmf = (
+        _log_binom(n_tail, x)
+        + _log_binom(n_universe - n_tail, n_draws - x)
+        - _log_binom(np.int64(n_universe), np.int64(n_draws))
+    )
+
+    # Per-tail logsumexp
+    log_max = np.maximum.reduceat(log_pmf, starts)
+    sums = np.add.reduceat(np.exp(log_pmf - log_max[tail]), starts)
+    pvals[nonempty] = np.minimum(1.0, np.exp(log_max) * sums)
+    return pvals
+
+
+def _get_universe_codes(library: CompiledLibrary) -> np.ndarray:
+    """Vocabulary code of every background gene, -1 if it is not an approved symbol."""
+    codes = library.derived.get("universe_codes")
+    if codes is None:
+        codes = get_symbol_vocabulary().encode(pd.Series(library.universe))
+        library.derived["universe_codes"] = codes
+    return codes
+
+
+def _get_set_layout(library: CompiledLibrary) -> tuple[np.ndarray, np.ndarray]:
+    """Set index of every CSR member, and set sizes over approved background genes."""
+    layout = library.derived.get("ora_set_layout")
+    if layout is None:
+        indptr = library.set_indptr
+        n_sets = len(indptr) - 1
+        set_of_member = np.repeat(np.arange(n_sets), np.diff(indptr))
+        approved = _get_universe_codes(library) >= 0
+        set_sizes = np.bincount(set_of_member[approved[library.set_indices]], minlength=n_sets)
+        layout = library.derived["ora_set_layout"] = (set_of_member, set_sizes)
+    return layout
+
+
+def _match_input(genes: Iterable[str]) -> tuple[pd.Series, np.ndarray, dict]:
+    """Stripped input symbols with their vocabulary codes, as for GSEA (see match_symbols)."""
+    symbols = pd.Series([str(g) for g in genes], dtype=object).str.strip()
+    codes, match_counts = match_symbols(symbols)
+    return symbols, codes, match_counts
+
+
+def run_ora(genes: Iterable[str], gmt_name: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Over-representation analysis of an unranked gene list against one library.
+
+    Input symbols are matched to approved symbols as for GSEA (case-insensitive, then
+    synonyms and previous symbols), and the background and gene sets are restricted
+    to approved symbols. Each gene set is tested with a one-sided hypergeometric test
+    against that background, for all sets at once, followed by Benjamini-Hochberg
+    (FDR) and Sidak correction. Gene sets are limited to the same sizes as GSEA.
+    Results use the GSEA schema: ES is the fold enrichment, NES its log2, 'Number of
+    input genes' the overlap with the input and 'Leading edge genes' the overlapping
+    genes. Only sets with at least one input gene are returned.
+
+    Args:
+        genes: Gene symbols of the hit list
+        gmt_name: Name of GMT library to use
+
+    Returns:
+        Tuple of (DataFrame with ORA results, overlap_stats dict as for GSEA)
+
+    Raises:
+        ValueError: If gmt_name is invalid or no input gene is in the library background
+    """
+    return _run_ora(*_match_input(genes), gmt_name)
+
+
+def _run_ora(
+    symbols: pd.Series, codes: np.ndarray, match_counts: dict, gmt_name: str
+) -> tuple[pd.DataFrame, dict]:
+    library = get_library(gmt_name)
+    universe = library.universe
+    indptr, indices = library.set_indptr, library.set_indices
+
+    overlap_stats, in_vocabulary = input_overlap_stats(symbols, codes, library, gmt_name)
+    overlap_stats.update(match_counts)
+
+    # Universe restricted to approved background genes, like the GSEA signature
+    universe_codes = _get_universe_codes(library)
+    approved = universe_codes >= 0
+    hit_mask = approved & in_vocabulary[universe_codes]
+    n_hits = int(hit_mask.sum())
+    if n_hits == 0:
+        raise ValueError(f"None of the input genes are in the {gmt_name} background")
+
+    # --- Overlap of every gene set with the hit list ---
+    n_sets = len(indptr) - 1
+    set_of_member, set_sizes = _get_set_layout(library)
+    member_hit = hit_mask[indices]
+    overlap = np.bincount(set_of_member[member_hit], minlength=n_sets)
+
+    tested = np.flatnonzero((set_sizes >= MIN_SET_SIZE) & (set_sizes <= MAX_SET_SIZE))
+    k, n = overlap[tested], set_sizes[tested]
+    n_universe = int(approved.sum())
+
+    keep = k > 0
+
+    # P(X >= k) for X ~ Hypergeom(universe, set size, hits); exactly 1 without overlap
+    pvals = np.ones(len(tested))
+    pvals[keep] = hypergeom_upper_tail(k[keep], n_universe, n[keep], n_hits)
+    fold = k / (n * n_hits / n_universe)
+    if len(pvals) > 1:
+        fdr = multipletests(pvals, method="fdr_bh")[1]
+        # Sidak takes log1p(-p), which is -inf (and warns) for p == 1
+        with np.errstate(divide="ignore"):
+            sidak = multipletests(pvals, method="sidak")[1]
+    else:
+        fdr = sidak = pvals
+
+    kept_sets = tested[keep]
+    leading_edge = [
+        universe[indices[indptr[i]:indptr[i + 1]][member_hit[indptr[i]:indptr[i + 1]]]].tolist()
+        for i in kept_sets
+    ]
+
+    raw_df = pd.DataFrame(
+        {
+            "es": fold[keep],
+            "nes": np.log2(fold[keep]),
+            "pval": pvals[keep],
+            "sidak": sidak[keep],
+            "fdr": fdr[keep],
+            "geneset_size": k[keep],
+            "leading_edge": leading_edge,
+        },
+        index=pd.Index([library.set_names[i] for i in kept_sets], name="Term"),
+    ).sort_values("pval", kind="stable")
+
+    # Most significant first, for libraries with a hierarchy too
+    return annotate_results(raw_df, library, keep_order=True), overlap_stats
+
+
+def run_ora_all_libraries(genes: Iterable[str]) -> list[tuple[str, pd.DataFrame, dict]]:
+    """
+    Run ORA of the same hit list against every available library.
+
+    Libraries without any input gene in their background are skipped.
+
+    Returns:
+        List of (library name, results DataFrame, overlap_stats dict)
+    """
+    # Symbol matching does not depend on the library, so it is done once
+    matched = _match_input(genes)
+    results = []
+    for gmt_name in available_gmt_files():
+        try:
+            res_df, overlap_stats = _run_ora(*matched, gmt_name)
+        except ValueError as exc:
+            logger.info("Skipping ORA for %s: %s", gmt_name, exc)
+            continue
+        results.append((gmt_name, res_df, overlap_stats))
+    return results
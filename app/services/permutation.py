@@ -0,0 +1,314 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import math
+import threading
+
+import blitzgsea as blitz
+import numpy as np
+import pandas as pd
+from statsmodels.stats.multitest import multipletests
+
+from app.services.library import MAX_SET_SIZE, MIN_SET_SIZE
+from app.services.rerank import RAW_COLUMNS, rank_signature
+from app.services.scheduler import get_cpu_scheduler, limit_native_threads
+
+logger = logging.getLogger(__name__)
+
+# Random gene sets drawn per round; early stopping is checked after each round
+PERMUTATION_BATCH = 100
+# A set stops once this many null ES are at least as extreme as its own (Besag-Clifford)
+EARLY_STOP_HITS = 10
+# Set sizes are split into this many chunks with their own random streams, independent
+# of the process count, so results only depend on the seed
+SIZE_CHUNKS = 16
+
+
+def null_enrichment_scores(weights: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Enrichment scores of a batch of gene sets, one per row of `positions` (ranks of
+    the set's genes in the signature, sorted ascending), as in blitzgsea's running sum.
+
+    The running sum peaks right at a hit or right before one, so only those 2k points
+    of each row are evaluated instead of the whole signature.
+    """
+    n_total = len(weights)
+    k = positions.shape[1]
+    w = weights[positions]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w = w / w.sum(axis=1, keepdims=True)
+    misses = (positions - np.arange(k)) / (n_total - k)
+    at_hit = np.cumsum(w, axis=1) - misses
+    before_hit = at_hit - w
+    top = at_hit.max(axis=1)
+    bottom = before_hit.min(axis=1)
+    return np.where(np.abs(top) >= np.abs(bottom), top, bottom)
+
+
+def _leading_edge(running_sum: np.ndarray, hits: np.ndarray, genes: np.ndarray) -> str:
+    """blitzgsea's leading edge (same genes), listed in rank order."""
+    rmax = np.argmax(running_sum)
+    rmin = np.argmin(running_sum)
+    if running_sum[rmax] > np.abs(running_sum[rmin]):
+        edge = hits[hits < rmax]
+    else:
+        edge = hits[hits >= rmin]
+    return ",".join(genes[edge])
+
+
+def _sample_without_replacement(rng: np.random.Generator, n_total: int, k: int, rows: int) -> np.ndarray:
+    """
+    Random draws of k distinct positions out of 0..n_total-1, one row per permutation,
+    in draw order: the first s positions of a row are a uniformly random subset of size s.
+
+    The draws are the first k distinct values of a slightly longer stream of draws
+    with replacement, which is uniform like drawing without replacement. Repeats are
+    found by one sort of the stream per batch, packed with each draw's place in it,
+    so work per row grows with k rather than n_total. Rows that got fewer than k
+    distinct values are drawn again. When k is close to n_total, the k smallest of
+    n_total random keys are taken instead.
+    """
+    # Draws giving k distinct values plus 4 standard deviations, on average
+    target = k + 4 * math.sqrt(k) + 8
+    if 2 * k > n_total or target >= n_total:
+        keys = rng.random((rows, n_total))
+        sample = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(keys, sample, axis=1), axis=1)
+        return np.take_along_axis(sample, order, axis=1)
+
+    m = math.ceil(-n_total * math.log1p(-target / n_total))
+    shift = (m - 1).bit_length()
+    dtype = np.int32 if n_total << shift < 2**31 else np.int64
+    sample = np.empty((rows, k), dtype=dtype)
+    pending = np.arange(rows)
+    while len(pending):
+        draws = rng.integers(0, n_total, size=(len(pending), m), dtype=dtype)
+        # Sorted by value, then by place in the stream: a value's first draw leads
+        keys = (draws << shift) | np.arange(m, dtype=dtype)
+        keys.sort(axis=1)
+        values = keys >> shift
+        new = np.ones(keys.shape, dtype=bool)
+        np.not_equal(values[:, 1:], values[:, :-1], out=new[:, 1:])
+        first = np.empty_like(new)
+        np.put_along_axis(first, keys & ((1 << shift) - 1), new, axis=1)
+
+        taken = np.cumsum(first, axis=1, dtype=np.int32)
+        keep = first & (taken <= k)
+        complete = taken[:, -1] >= k
+        if complete.all():
+            sample[pending] = draws[keep].reshape(-1, k)
+            break
+        sample[pending[complete]] = draws[complete][keep[complete]].reshape(-1, k)
+        pending = pending[~complete]
+    return sample
+
+
+def _permute_chunk(task: tuple) -> dict[int, dict]:
+    """
+    Null distributions for one chunk of set sizes. Each round draws random gene sets
+    of the largest size still needed in the chunk (see _sample_without_replacement); smaller
+    sizes use the first genes of each draw, so one draw serves every size.
+    """
+    weights, observed, n_perm, seed_seq = task
+    rng = np.random.default_rng(seed_seq)
+    n_total = len(weights)
+
+    state = {
+        size: {
+            "hits": np.zeros(len(es), dtype=np.int64),
+            "same_sign": np.zeros(len(es), dtype=np.int64),
+            "active": np.ones(len(es), dtype=bool),
+            "pos_sum": 0.0, "pos_n": 0, "neg_sum": 0.0, "neg_n": 0,
+        }
+        for size, es in observed.items()
+    }
+
+    drawn = 0
+    while drawn < n_perm and any(s["active"].any() for s in state.values()):
+        batch = min(PERMUTATION_BATCH, n_perm - drawn)
+        # Sizes whose sets all stopped need no genes drawn for them
+        k_active = max(size for size, s in state.items() if s["active"].any())
+        sample = _sample_without_replacement(rng, n_total, k_active, batch)
+        drawn += batch
+
+        for size, es in observed.items():
+            s = state[size]
+            if not s["active"].any():
+                continue
+            null = null_enrichment_scores(weights, np.sort(sample[:, :size], axis=1))
+            positive = null > 0
+            s["pos_sum"] += float(null[positive].sum())
+            s["pos_n"] += int(positive.sum())
+            s["neg_sum"] += float(-null[~positive].sum())
+            s["neg_n"] += int((~positive).sum())
+
+            active = np.flatnonzero(s["active"])
+            obs = es[active][:, None]
+            same = np.where(obs > 0, positive[None, :], ~positive[None, :])
+            extreme = same & (np.abs(null)[None, :] >= np.abs(obs))
+            s["same_sign"][active] += same.sum(axis=1)
+            s["hits"][active] += extreme.sum(axis=1)
+            s["active"][active] = s["hits"][active] < EARLY_STOP_HITS
+
+    return state
+
+
+def _chunk_sizes(sizes: list[int], n_chunks: int) -> list[list[int]]:
+    """Split sorted set sizes into contiguous chunks of roughly equal total size."""
+    bounds = np.cumsum(sizes) / sum(sizes) * n_chunks
+    chunks: list[list[int]] = [[] for _ in range(n_chunks)]
+    for size, bound in zip(sizes, bounds):
+        chunks[min(int(np.ceil(bound)) - 1, n_chunks - 1)].append(size)
+    return [c for c in chunks if c]
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Return the process-wide worker pool, sized to the CPU scheduler's budget and
+    shared by all permutation jobs; each job limits itself to its own share.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=get_cpu_scheduler().cpu_budget,
+                initializer=limit_native_threads,
+                initargs=(1,),
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next job starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _map_chunks(tasks: list[tuple], processes: int) -> list[dict[int, dict]]:
+    """Run _permute_chunk over tasks, at most `processes` at a time; results in task order."""
+    if processes <= 1 or len(tasks) <= 1:
+        return [_permute_chunk(task) for task in tasks]
+
+    pool = _get_pool()
+    results: list[dict[int, dict] | None] = [None] * len(tasks)
+    pending: dict[Future, int] = {}
+    queued = iter(enumerate(tasks))
+    try:
+        for i, task in queued:
+            pending[pool.submit(_permute_chunk, task)] = i
+            if len(pending) >= processes:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+                task = next(queued, None)
+                if task is not None:
+                    pending[pool.submit(_permute_chunk, task[1])] = task[0]
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    return results
+
+
+def permutation_gsea(
+    signature: pd.DataFrame,
+    library_sets: dict[str, list[str]],
+    n_perm: int = 1000,
+    seed: int = 0,
+    processes: int = 1,
+) -> pd.DataFrame:
+    """
+    GSEA with p-values from gene set permutations instead of blitzgsea's gamma fit.
+
+    Enrichment scores and leading edges are computed exactly as blitzgsea does. Each
+    set is compared with the null ES of random sets of the same size that have the
+    same sign as its ES ("same-sign draws"); hits are those at least as extreme. Sets
+    stop drawing once they have EARLY_STOP_HITS hits and get p = hits / same-sign
+    draws, so only sets that may be significant use all n_perm draws; those get
+    p = (hits + 1) / (same-sign draws + 1). The smallest reachable p-value is thus
+    1 / (same-sign draws + 1), about 2 / n_perm when both signs are equally common.
+
+    NES is ES divided by the mean absolute null ES of the same sign, as in the
+    original GSEA. It is not on the scale of the gamma method's NES, which is the
+    standard normal quantile of the set's tail probability. Results are
+    deterministic for a given seed.
+
+    Returns:
+        Raw results indexed by term, in blitzgsea's layout
+    """
+    ranked, abs_signature, signature_map = rank_signature(signature)
+    ranked_genes = ranked.index.to_numpy(dtype=object)
+
+    terms, sizes, scores, leading_edges = [], [], [], []
+    for term, set_genes in library_sets.items():
+        stripped = [gene for gene in set(set_genes) if gene in signature_map]
+        gsize = len(stripped)
+        if gsize < MIN_SET_SIZE or gsize > MAX_SET_SIZE:
+            continue
+        running_sum, es = blitz.enrichment_score(abs_signature, signature_map, stripped)
+        terms.append(term)
+        sizes.append(gsize)
+        scores.append(float(es))
+        hits = np.sort([signature_map[gene] for gene in stripped])
+        leading_edges.append(_leading_edge(running_sum, hits, ranked_genes))
+    if not terms:
+        raise ValueError(
+            f"No gene set has between {MIN_SET_SIZE} and {MAX_SET_SIZE} genes in the input"
+        )
+
+    sizes_arr = np.array(sizes)
+    scores_arr = np.array(scores)
+    distinct = sorted(set(sizes))
+    chunks = _chunk_sizes(distinct, min(SIZE_CHUNKS, len(distinct)))
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [
+        (abs_signature, {size: scores_arr[sizes_arr == size] for size in chunk}, n_perm, seed_seq)
+        for chunk, seed_seq in zip(chunks, seeds)
+    ]
+    states = _map_chunks(tasks, processes)
+    null_state = {size: s for state in states for size, s in state.items()}
+
+    pvals = np.ones(len(terms))
+    nes = np.full(len(terms), np.nan)
+    for size, s in null_state.items():
+        members = np.flatnonzero(sizes_arr == size)
+        hits, same = s["hits"], s["same_sign"]
+        stopped = ~s["active"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = np.where(stopped, hits / np.maximum(same, 1), (hits + 1) / (same + 1))
+        pvals[members] = np.minimum(p, 1.0)
+        es = scores_arr[members]
+        pos_mean = s["pos_sum"] / s["pos_n"] if s["pos_n"] else np.nan
+        neg_mean = s["neg_sum"] / s["neg_n"] if s["neg_n"] else np.nan
+        nes[members] = np.where(es > 0, es / pos_mean, es / neg_mean)
+
+    if len(pvals) > 1:
+        fdr = multipletests(pvals, method="fdr_bh")[1]
+        with np.errstate(divide="ignore"):
+            sidak = multipletests(pvals, method="sidak")[1]
+    else:
+        fdr = sidak = pvals
+
+    raw_df = pd.DataFrame(
+        {
+            "es": scores_arr,
+            "nes": nes,
+            "pval": pvals,
+            "sidak": sidak,
+            "fdr": fdr,
+            "geneset_size": sizes_arr,
+            "leading_edge": leading_edges,
+        },
+        index=pd.Index(terms, name="Term"),
+    )
+    return raw_df[RAW_COLUMNS].sort_values("pval", kind="stable")
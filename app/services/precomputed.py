@@ -0,0 +1,315 @@
+from pathlib import Path
+from datetime import datetime, timezone
+import json
+import logging
+import re
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from app.config import get_config
+from app.services.library import get_library_catalogue
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# Columns that vary per disease; everything else is a property of the library term
+RESULT_SCHEMA = pa.schema([
+    ("ID", pa.string()),
+    ("ES", pa.float64()),
+    ("NES", pa.float64()),
+    ("FDR", pa.float64()),
+    ("p-value", pa.float64()),
+    ("Sidak's p-value", pa.float64()),
+    ("Number of input genes", pa.int64()),
+    ("Leading edge genes", pa.string()),
+])
+INDEX_SCHEMA = pa.schema([
+    ("diseaseId", pa.string()),
+    ("offset", pa.int64()),
+    ("length", pa.int64()),
+    ("used_count", pa.int64()),
+    ("total_input", pa.int64()),
+    ("used_percent", pa.float64()),
+    ("matched_count", pa.int64()),
+    ("matched_percent", pa.float64()),
+    ("case_remapped_count", pa.int64()),
+    ("remapped_count", pa.int64()),
+])
+# Overlap stats stored per disease, as returned by the live analysis
+OVERLAP_FIELDS = INDEX_SCHEMA.names[3:]
+ANNOTATION_COLUMNS = ["ID", "Link", "Pathway", "Pathway size", "Pathway genes", "Parent pathway"]
+RESULT_COLUMNS = [
+    "ID", "Link", "Pathway", "ES", "NES", "FDR", "p-value", "Sidak's p-value",
+    "Number of input genes", "Leading edge genes", "Pathway size", "Pathway genes",
+    "Parent pathway",
+]
+
+
+def library_file_stem(gmt_name: str) -> str:
+    """Filesystem-safe stem for a library name, e.g. 'GO cellular component/GO:CC_2025' -> 'GO_cellular_component__GO_CC_2025'."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", gmt_name.replace("/", "__"))
+
+
+class PrecomputedLibraryWriter:
+    """
+    Stream per-disease GSEA results for one library into an Arrow IPC file.
+
+    Diseases must be added in sorted order so each disease occupies one contiguous
+    row range; the (offset, length) of that range is recorded in a separate index
+    file alongside the overlap stats. Library-level columns (names, links, gene
+    lists, parents) are written once to an annotations file instead of per row.
+    The library version of the results goes to the manifest entry, so results of
+    an outdated library can be told apart.
+    """
+
+    def __init__(self, root: Path, gmt_name: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.gmt_name = gmt_name
+        stem = library_file_stem(gmt_name)
+        self.files = {
+            "results": f"{stem}.results.arrow",
+            "index": f"{stem}.index.arrow",
+            "annotations": f"{stem}.annotations.arrow",
+        }
+        self._sink = pa.OSFile(str(self._tmp_path("results")), "wb")
+        self._writer = pa.ipc.new_file(self._sink, RESULT_SCHEMA)
+        self._offset = 0
+        self._index_rows: list[dict] = []
+        self._annotations: dict[str, dict] = {}
+        self.library_version: str | None = None
+
+    def _tmp_path(self, kind: str) -> Path:
+        # Files are swapped in by rename: a running server may still map the old ones
+        return self.root / f".{self.files[kind]}.tmp"
+
+    def add(self, disease_id: str, res_df: pd.DataFrame, overlap_stats: dict) -> None:
+        """
+        Append the results of one disease.
+
+        Raises:
+            ValueError: If the results come from another version of the library
+                than the diseases added before
+        """
+        library_version = overlap_stats.get("library_version")
+        if self.library_version is None:
+            self.library_version = library_version
+        elif library_version != self.library_version:
+            raise ValueError(
+                f"Library changed while precomputing {self.gmt_name}: "
+                f"{library_version} after {self.library_version}"
+            )
+        table = pa.Table.from_pandas(
+            res_df[RESULT_SCHEMA.names], schema=RESULT_SCHEMA, preserve_index=False
+        )
+        self._writer.write_table(table)
+        self._index_rows.append({
+            "diseaseId": disease_id,
+            "offset": self._offset,
+            "length": table.num_rows,
+            "used_count": int(overlap_stats.get("used_count", 0)),
+            "total_input": int(overlap_stats.get("total_input", 0)),
+            "used_percent": float(overlap_stats.get("used_percent", 0.0)),
+            "matched_count": int(overlap_stats.get("matched_count", 0)),
+            "matched_percent": float(overlap_stats.get("matched_percent", 0.0)),
+            "case_remapped_count": int(overlap_stats.get("case_remapped_count", 0)),
+            "remapped_count": int(overlap_stats.get("remapped_count", 0)),
+        })
+        self._offset += table.num_rows
+
+        # Keep the first annotation seen for each term; they do not depend on the input
+        new_terms = res_df[~res_df["ID"].isin(self._annotations.keys())]
+        for row in new_terms[ANNOTATION_COLUMNS].drop_duplicates("ID").to_dict(orient="records"):
+            self._annotations[row["ID"]] = row
+
+    def close(self) -> dict:
+        """Finalize the files and return the manifest entry for this library."""
+        self._writer.close()
+        self._sink.close()
+
+        index = pa.Table.from_pylist(self._index_rows, schema=INDEX_SCHEMA)
+        with pa.OSFile(str(self._tmp_path("index")), "wb") as sink:
+            with pa.ipc.new_file(sink, INDEX_SCHEMA) as writer:
+                writer.write_table(index)
+
+        annotations = pd.DataFrame(
+            list(self._annotations.values()), columns=ANNOTATION_COLUMNS
+        )
+        annotations_table = pa.Table.from_pandas(annotations, preserve_index=False)
+        with pa.OSFile(str(self._tmp_path("annotations")), "wb") as sink:
+            with pa.ipc.new_file(sink, annotations_table.schema) as writer:
+                writer.write_table(annotations_table)
+
+        for kind, name in self.files.items():
+            self._tmp_path(kind).replace(self.root / name)
+
+        return {
+            **self.files,
+            "library_version": self.library_version,
+            "diseases": len(self._index_rows),
+            "rows": self._offset,
+        }
+
+
+def write_manifest(root: Path, release: str, libraries: dict[str, dict]) -> Path:
+    """Write the store manifest. Written last so readers never see a partial store."""
+    path = Path(root) / MANIFEST_NAME
+    manifest = {
+        "release": release,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "libraries": libraries,
+    }
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    tmp_path.replace(path)
+    return path
+
+
+class _LoadedLibrary:
+    """Memory-mapped results plus in-memory index and annotations for one library."""
+
+    def __init__(self, root: Path, entry: dict):
+        source = pa.memory_map(str(root / entry["results"]), "r")
+        # Zero-copy: batches reference the mapped file, pages are loaded on access
+        self.results = pa.ipc.open_file(source).read_all()
+
+        self.library_version: str | None = entry.get("library_version")
+        with pa.memory_map(str(root / entry["index"]), "r") as index_source:
+            index_df = pa.ipc.open_file(index_source).read_pandas()
+        # Stores written before all overlap stats were kept only have some of them
+        self.overlap_fields = [name for name in OVERLAP_FIELDS if name in index_df.columns]
+        columns = ["diseaseId", "offset", "length", *self.overlap_fields]
+        self.index: dict[str, tuple] = {
+            row[0]: row[1:] for row in zip(*(index_df[name].tolist() for name in columns))
+        }
+
+        with pa.memory_map(str(root / entry["annotations"]), "r") as annotations_source:
+            self.annotations = (
+                pa.ipc.open_file(annotations_source).read_pandas().set_index("ID")
+            )
+
+
+class PrecomputedStore:
+    """
+    Read-only lookup of precomputed GSEA results by (diseaseId, library).
+
+    The manifest's mtime is checked on every access; when precompute_gsea writes a
+    new manifest, it is re-read and libraries are memory-mapped again on next use.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.manifest: dict = {"release": None, "libraries": {}}
+        self._manifest_mtime: int | None = None
+        self._libraries: dict[str, _LoadedLibrary] = {}
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _refresh(self) -> None:
+        manifest_path = self.root / MANIFEST_NAME
+        try:
+            mtime = manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+            if mtime is None:
+                manifest = {"release": None, "libraries": {}}
+            else:
+                manifest = json.loads(manifest_path.read_text())
+            # Cleared first, so a reader never pairs the new manifest with old mappings;
+            # in-flight lookups keep their reference to the previous mapping
+            self._libraries = {}
+            self.manifest = manifest
+            self._manifest_mtime = mtime
+            if mtime is not None:
+                logger.info(
+                    "Loaded precomputed manifest (release: %s, libraries: %d)",
+                    manifest.get("release"), len(manifest["libraries"]),
+                )
+
+    @property
+    def release(self) -> str | None:
+        self._refresh()
+        return self.manifest.get("release")
+
+    def libraries(self) -> list[str]:
+        self._refresh()
+        return list(self.manifest["libraries"].keys())
+
+    def _get_library(self, manifest: dict, gmt_name: str) -> _LoadedLibrary:
+        library = self._libraries.get(gmt_name)
+        if library is not None:
+            return library
+        with self._lock:
+            if manifest is not self.manifest:
+                # Reloaded meanwhile: map the files of the manifest this lookup started with
+                return _LoadedLibrary(self.root, manifest["libraries"][gmt_name])
+            if gmt_name not in self._libraries:
+                library = _LoadedLibrary(self.root, manifest["libraries"][gmt_name])
+                logger.info("Memory-mapped precomputed results for library %s", gmt_name)
+                current = get_library_catalogue().available().get(gmt_name)
+                if current is not None and library.library_version != current.versioned_name:
+                    logger.warning(
+                        "Precomputed results for %s were computed with %s, current library is %s",
+                        gmt_name, library.library_version, current.versioned_name,
+                    )
+                self._libraries[gmt_name] = library
+            return self._libraries[gmt_name]
+
+    def lookup(self, disease_id: str, gmt_name: str) -> tuple[pd.DataFrame, dict] | None:
+        """
+        Return precomputed results for a disease and library.
+
+        Args:
+            disease_id: Open Targets disease ID (e.g. 'EFO_0003767')
+            gmt_name: Name of GMT library
+
+        Returns:
+            Tuple of (DataFrame with GSEA results, overlap_stats dict), or None if the
+            disease was not precomputed
+
+        Raises:
+            ValueError: If gmt_name is not present in the store
+        """
+        self._refresh()
+        manifest = self.manifest
+        if gmt_name not in manifest["libraries"]:
+            msg = "No precomputed results for gmt_name. Choose from: " + str(list(manifest["libraries"]))
+            raise ValueError(msg)
+
+        library = self._get_library(manifest, gmt_name)
+        entry = library.index.get(disease_id)
+        if entry is None:
+            return None
+
+        offset, length, *overlap = entry
+        res_df = library.results.slice(offset, length).to_pandas()
+        res_df = res_df.join(library.annotations, on="ID")[RESULT_COLUMNS]
+        overlap_stats = {
+            "library": gmt_name,
+            "library_version": library.library_version,
+            **dict(zip(library.overlap_fields, overlap)),
+        }
+        return res_df, overlap_stats
+
+
+_store: PrecomputedStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_precomputed_store() -> PrecomputedStore:
+    """Return the process-wide store for the configured PRECOMPUTED_DIR."""
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            _store = PrecomputedStore(get_config().PRECOMPUTED_DIR)
+        return _store
@@ -0,0 +1,251 @@
+from dataclasses import dataclass
+import logging
+
+import blitzgsea as blitz
+import numpy as np
+import pandas as pd
+# Coupled to blitzgsea internals (mpsci, pdf_cache and its key, the null model tuple,
+# gsea()'s p-value steps), which is why pyproject.toml pins blitzgsea exactly.
+# Re-check this module against the new source before bumping it.
+from blitzgsea.mpsci import gammacdf, invcdf
+from mpmath import mp
+from scipy.stats import gamma
+from statsmodels.stats.multitest import multipletests
+
+from app.services.library import MAX_SET_SIZE, MIN_SET_SIZE
+
+logger = logging.getLogger(__name__)
+
+# blitzgsea.gsea() defaults used by the full analysis
+PERMUTATIONS = 1000
+ANCHORS = 40
+ACCURACY = 40
+DEEP_ACCURACY = 50
+KL_BINS = 200
+
+RAW_COLUMNS = ["es", "nes", "pval", "sidak", "fdr", "geneset_size", "leading_edge"]
+
+
+@dataclass
+class EngineState:
+    """Ranked signature and raw blitzgsea output of one run, kept for delta re-ranking."""
+
+    gmt_name: str
+    signature: pd.DataFrame  # 'symbol', 'globalScore' exactly as passed to blitzgsea
+    raw_results: pd.DataFrame  # blitzgsea output indexed by term
+    null_model: tuple | None = None  # blitzgsea gamma-fit interpolators for this signature
+
+    def size_bytes(self) -> int:
+        return int(
+            self.signature.memory_usage(index=True, deep=True).sum()
+            + self.raw_results.memory_usage(index=True, deep=True).sum()
+        )
+
+
+def rank_signature(signature: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray, dict[str, int]]:
+    """Sort, dedupe and center a signature the same way blitzgsea.gsea() does."""
+    sig = signature.copy()
+    sig.columns = ["i", "v"]
+    sig = sig.sort_values("v", ascending=False).set_index("i")
+    sig = sig[~sig.index.duplicated(keep="first")]
+    sig.loc[:, "v"] -= np.mean(sig.loc[:, "v"])
+    abs_signature = np.array(np.abs(sig.loc[:, "v"]))
+    signature_map = {gene: i for i, gene in enumerate(sig.index)}
+    return sig, abs_signature, signature_map
+
+
+def _anchor_set_sizes(library: dict[str, set], n_genes: int) -> list[int]:
+    """Set sizes blitzgsea.estimate_parameters() fits the null at."""
+    largest = max(len(genes) for genes in library.values())
+    sizes = {int(x) for x in np.linspace(1, largest, ANCHORS)}
+    sizes.update([1, 2, 3, 4, 5, 6, 7, 12, 16, 20, 30, 40, 50, 60, 70, 80, 100])
+    sizes.update([largest + 10, largest + 30])
+    return [size for size in sorted(sizes) if size <= n_genes]
+
+
+def estimate_null_model(
+    ranked: pd.DataFrame,
+    abs_signature: np.ndarray,
+    signature_map: dict[str, int],
+    library: dict[str, set],
+    seed: int = 0,
+) -> tuple:
+    """
+    blitzgsea.estimate_parameters() in this process, for the gsea() defaults.
+
+    blitzgsea 1.3.54's single-process branch calls estimate_anchor() without its
+    required `ks_disable` argument and fails with a TypeError (only the pool branch
+    passes it). This is that branch with the argument passed, step for step, so
+    processes == 1 never reaches the broken code and results match a working
+    single-process blitzgsea run.
+
+    Raises:
+        ValueError: If the library has no gene sets
+    """
+    if not library:
+        raise ValueError("The gene set library is empty, there is no null model to estimate")
+    # gsea() seeds numpy before estimating; the pos_ratio jitter below draws from it
+    np.random.seed(seed)
+    anchors = _anchor_set_sizes(library, len(abs_signature))
+    fits = np.array([
+        blitz.estimate_anchor(
+            ranked, abs_signature, signature_map, size, PERMUTATIONS, False, int(seed + size),
+            ks_disable=False,
+        )
+        for size in anchors
+    ])
+    alpha_pos, beta_pos, ks_pos, alpha_neg, beta_neg, ks_neg, pos_ratio = fits.T
+    anchors = np.array(anchors, dtype=float)
+    # Same jitter as blitzgsea, against numeric instability of the fit
+    pos_ratio = pos_ratio - np.abs(0.0001 * np.random.randn(len(pos_ratio)))
+    return (
+        blitz.loess_interpolation(anchors, alpha_pos),
+        blitz.loess_interpolation(anchors, beta_pos, frac=0.15),
+        blitz.loess_interpolation(anchors, pos_ratio, frac=0.5),
+        blitz.loess_interpolation(anchors, alpha_neg),
+        blitz.loess_interpolation(anchors, beta_neg, frac=0.15),
+        np.mean(ks_pos),
+        np.mean(ks_neg),
+    )
+
+
+def _pdf_cache_key(signature: pd.DataFrame) -> int:
+    # blitzgsea keys its cache by the hash of the renamed input frame
+    sig = signature.copy()
+    sig.columns = ["i", "v"]
+    return hash(sig.to_string())
+
+
+def discard_null_model(signature: pd.DataFrame) -> None:
+    """Drop a signature's null model from blitzgsea's in-process cache, which never evicts."""
+    blitz.pdf_cache.pop(_pdf_cache_key(signature), None)
+
+
+def cached_null_model(signature: pd.DataFrame, library_sets: dict[str, list[str]]) -> tuple:
+    """
+    Null model of a signature from blitzgsea's in-process cache, estimated in this
+    process and stored there if missing, so a following blitzgsea.gsea() call on the
+    same signature reuses it instead of estimating it again.
+    """
+    sig_hash = _pdf_cache_key(signature)
+    cached = blitz.pdf_cache.get(sig_hash)
+    if cached is not None:
+        return cached["model"]
+
+    logger.info("Estimating null model in-process")
+    ranked, abs_signature, signature_map = rank_signature(signature)
+    library = blitz.clean_library({k: set(v) for k, v in library_sets.items()}, ranked)
+    model = estimate_null_model(ranked, abs_signature, signature_map, library)
+    xvalues, pdf = blitz.create_pdf(np.array(ranked["v"]), KL_BINS)
+    blitz.pdf_cache[sig_hash] = {"xvalues": xvalues, "pdf": pdf, "model": model}
+    return model
+
+
+def _null_model(state: EngineState, library_sets: dict[str, list[str]]) -> tuple:
+    """
+    Null model of the base signature: taken from blitzgsea's in-process cache when the
+    base run happened in this process, otherwise re-estimated once.
+    """
+    if state.null_model is None:
+        state.null_model = cached_null_model(state.signature, library_sets)
+    return state.null_model
+
+
+def _score_gene_set(es: float, gsize: int, model: tuple) -> tuple[float, float]:
+    """NES and p-value of an enrichment score under the gamma null (as in blitzgsea.gsea)."""
+    f_alpha_pos, f_beta_pos, f_pos_ratio, f_alpha_neg, f_beta_neg, _, _ = model
+    pos_ratio = max(0, min(1.0, f_pos_ratio(gsize)))
+    mp.dps = ACCURACY
+    mp.prec = ACCURACY
+
+    if es > 0:
+        alpha, beta = float(f_alpha_pos(gsize)), float(f_beta_pos(gsize))
+        prob = gamma.cdf(es, alpha, scale=beta)
+        if prob > 0.999999999 or prob < 0.00000000001:
+            mp.dps = DEEP_ACCURACY
+            mp.prec = DEEP_ACCURACY
+            prob = gammacdf(es, alpha, beta, dps=DEEP_ACCURACY)
+        prob_two_tailed = np.min([0.5, (1 - np.min([prob * pos_ratio + 1 - pos_ratio, 1]))])
+        nes = invcdf(1 - np.min([1, prob_two_tailed]))
+    else:
+        alpha, beta = float(f_alpha_neg(gsize)), float(f_beta_neg(gsize))
+        prob = gamma.cdf(-es, alpha, scale=beta)
+        if prob > 0.999999999 or prob < 0.00000000001:
+            mp.dps = DEEP_ACCURACY
+            mp.prec = DEEP_ACCURACY
+            prob = gammacdf(-es, alpha, beta, dps=DEEP_ACCURACY)
+        prob_two_tailed = np.min([0.5, (1 - np.min([((prob - prob * pos_ratio) + pos_ratio), 1]))])
+        if prob_two_tailed == 0.5:
+            prob_two_tailed = prob_two_tailed - prob
+        nes = invcdf(np.min([1, prob_two_tailed]))
+
+    mp.dps = ACCURACY
+    mp.prec = ACCURACY
+    return -float(nes), float(2 * prob_two_tailed)
+
+
+def rerank(
+    base: EngineState,
+    signature: pd.DataFrame,
+    library_sets: dict[str, list[str]],
+    gene_to_terms: dict[str, tuple[str, ...]],
+    max_moved: int,
+) -> tuple[pd.DataFrame, tuple, dict] | None:
+    """
+    Update a base run for a new signature by recomputing only the gene sets that
+    contain a gene whose score changed (or that entered/left the signature).
+
+    No per-set running sums are kept: the base run's raw results are reused for
+    unaffected sets, and the ES of each affected set is recomputed in full against
+    the new ranking, then scored with the base run's null model.
+
+    Returns:
+        Tuple of (raw results indexed by term, null model, stats dict), or None if more
+        than max_moved genes changed and a full run is preferable
+    """
+    old_scores = base.signature.drop_duplicates("symbol").set_index("symbol")["globalScore"]
+    new_scores = signature.drop_duplicates("symbol").set_index("symbol")["globalScore"]
+    joined = pd.concat([old_scores.rename("old"), new_scores.rename("new")], axis=1)
+    moved = joined.index[joined["old"].ne(joined["new"])]
+    if len(moved) > max_moved:
+        return None
+
+    model = _null_model(base, library_sets)
+    ranked, abs_signature, signature_map = rank_signature(signature)
+
+    affected: set[str] = set()
+    for gene in moved:
+        affected.update(gene_to_terms.get(gene, ()))
+
+    rows = []
+    dropped = []
+    for term in affected:
+        stripped = [gene for gene in set(library_sets[term]) if gene in signature_map]
+        gsize = len(stripped)
+        if gsize < MIN_SET_SIZE or gsize > MAX_SET_SIZE:
+            dropped.append(term)
+            continue
+        running_sum, es = blitz.enrichment_score(abs_signature, signature_map, stripped)
+        leading_edge = blitz.get_leading_edge(running_sum, ranked, stripped, signature_map)
+        nes, pval = _score_gene_set(es, gsize, model)
+        rows.append((term, float(es), nes, pval, gsize, leading_edge))
+
+    updated = pd.DataFrame(
+        rows, columns=["Term", "es", "nes", "pval", "geneset_size", "leading_edge"]
+    ).set_index("Term")
+    raw_df = base.raw_results.drop(index=list(updated.index) + dropped, errors="ignore")
+    raw_df = pd.concat([raw_df, updated])
+
+    # Multiple-testing corrections depend on every p-value, so redo them for all sets
+    pvals = raw_df["pval"].to_numpy(dtype=float)
+    if len(pvals) > 1:
+        raw_df["fdr"] = multipletests(pvals, method="fdr_bh")[1]
+        raw_df["sidak"] = multipletests(pvals, method="sidak")[1]
+    else:
+        raw_df["fdr"] = pvals
+        raw_df["sidak"] = pvals
+    raw_df["geneset_size"] = raw_df["geneset_size"].astype(int)
+    raw_df = raw_df[RAW_COLUMNS].sort_values("pval", key=abs, ascending=True)
+
+    stats = {"moved_genes": len(moved), "recomputed_sets": len(rows)}
+    return raw_df, model, stats
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from pathlib import Path
+import logging
+import math
+import os
+import threading
+
+from app.config import get_config
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+CGROUP_V1_QUOTA = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+CGROUP_V1_PERIOD = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+# Environment variables read by OpenBLAS/MKL/OpenMP/numexpr when a process starts
+NATIVE_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def _read_cgroup_cpu_quota() -> float | None:
+    """Return the cgroup CPU quota in cores, or None if unlimited/unavailable."""
+    try:
+        if CGROUP_V2_CPU_MAX.exists():
+            quota, period = CGROUP_V2_CPU_MAX.read_text().split()[:2]
+            if quota == "max":
+                return None
+            return int(quota) / int(period)
+        if CGROUP_V1_QUOTA.exists() and CGROUP_V1_PERIOD.exists():
+            quota = int(CGROUP_V1_QUOTA.read_text().strip())
+            period = int(CGROUP_V1_PERIOD.read_text().strip())
+            if quota <= 0 or period <= 0:
+                return None
+            return quota / period
+    except (OSError, ValueError) as exc:
+        logger.warning("Could not read cgroup CPU limits: %s", exc)
+    return None
+
+
+def detect_cpu_limit() -> int:
+    """
+    Number of CPUs this process may use: the smallest of the cgroup quota
+    (container CPU limit), the scheduler affinity mask and os.cpu_count().
+    Fractional quotas are rounded up, with a minimum of 1.
+    """
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        available = os.cpu_count() or 1
+
+    quota = _read_cgroup_cpu_quota()
+    if quota is not None:
+        available = min(available, math.ceil(quota))
+    return max(1, available)
+
+
+def limit_native_threads(threads: int) -> None:
+    """
+    Pin BLAS/OpenMP thread pools so numpy/scipy work inside blitzgsea workers does
+    not oversubscribe the CPUs. Environment variables cover processes started later;
+    threadpoolctl applies the limit to libraries already loaded in this process
+    (and inherited by forked workers). Limits are process-wide, so this is applied
+    once at startup rather than per job.
+    """
+    for var in NATIVE_THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("threadpoolctl not installed; native thread pools not limited")
+        return
+    threadpool_limits(limits=threads)
+
+
+class CpuScheduler:
+    """
+    Split a fixed CPU budget between concurrent GSEA jobs.
+
+    Each job asks for a slot and receives a process count of
+    budget // jobs-in-flight (capped at max_processes), limited to the processes
+    not yet allocated to running jobs. Allocations are kept until the job finishes,
+    so running jobs never add up to more than the budget: once max_jobs are running
+    or every process is allocated, further jobs wait for a slot.
+    """
+
+    def __init__(self, cpu_budget: int, max_processes: int, max_jobs: int):
+        self.cpu_budget = max(1, cpu_budget)
+        self.max_processes = max(1, max_processes)
+        self.max_jobs = max(1, max_jobs)
+        self._in_flight = 0
+        self._allocated = 0
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _share(self) -> int:
+        # Caller holds self._condition; at least one process is free
+        fair_share = min(self.max_processes, self.cpu_budget // self._in_flight)
+        return max(1, min(fair_share, self.cpu_budget - self._allocated))
+
+    @contextmanager
+    def slot(self):
+        """Context manager yielding the number of processes the job may use."""
+        with self._condition:
+            while self._in_flight >= self.max_jobs or self._allocated >= self.cpu_budget:
+                self._condition.wait()
+            self._in_flight += 1
+            processes = self._share()
+            self._allocated += processes
+        try:
+            yield processes
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._allocated -= processes
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "cpu_budget": self.cpu_budget,
+            "max_processes": self.max_processes,
+            "max_jobs": self.max_jobs,
+            "in_flight": self._in_flight,
+            "allocated": self._allocated,
+        }
+
+
+_scheduler: CpuScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_cpu_scheduler() -> CpuScheduler:
+    """Return the process-wide scheduler, sized from config overrides or detected limits."""
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = get_config()
+            # Every worker process has its own scheduler, so split the CPUs between them
+            cpu_budget = config.GSEA_CPU_LIMIT or max(
+                1, detect_cpu_limit() // max(1, config.WEB_CONCURRENCY)
+            )
+            _scheduler = CpuScheduler(
+                cpu_budget=cpu_budget,
+                max_processes=config.GSEA_MAX_PROCESSES,
+                max_jobs=config.GSEA_MAX_CONCURRENT_JOBS or cpu_budget,
+            )
+            logger.info("GSEA CPU scheduler: %s", _scheduler.stats())
+        return _scheduler
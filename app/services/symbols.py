@@ -0,0 +1,167 @@
+from dataclasses import dataclass
+import logging
+import threading
+
+import gcsfs
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OT_RELEASE_GCS_PATH = "open-targets-pre-data-releases/25.09/output"
+# Target columns (lists of {label, source}) holding other names of an approved symbol
+ALIAS_COLUMNS = ["symbolSynonyms", "obsoleteSymbols"]
+
+
+@dataclass(frozen=True)
+class SymbolVocabulary:
+    """
+    Sorted approved symbols with hash indexes for mapping input symbols to codes
+    (positions in `symbols`). Lookups are exact first, then case-insensitive;
+    upper-case forms shared by several approved symbols are not matched.
+    Synonyms and previous symbols can be resolved separately with encode_aliases().
+    """
+
+    symbols: np.ndarray  # sorted approved symbols
+    exact: pd.Index  # same values as symbols
+    upper: pd.Index  # unambiguous upper-case symbols
+    upper_codes: np.ndarray  # code of each entry of `upper`
+    aliases: pd.Index  # sorted upper-case aliases naming a single approved symbol
+    alias_codes: np.ndarray  # code of each entry of `aliases`
+
+    @classmethod
+    def build(cls, approved_symbols, aliases: pd.DataFrame | None = None) -> "SymbolVocabulary":
+        """
+        Args:
+            approved_symbols: Approved gene symbols
+            aliases: Optional 'alias' and 'approvedSymbol' columns. Aliases naming
+                several approved symbols, or spelling one (in any case), are dropped.
+        """
+        symbols = np.array(sorted(approved_symbols), dtype=object)
+        upper = pd.Series(symbols).str.upper()
+        unambiguous = ~upper.duplicated(keep=False).to_numpy()
+        exact = pd.Index(symbols)
+
+        alias_keys = pd.Series([], dtype=object)
+        alias_codes = np.empty(0, dtype=np.int64)
+        if aliases is not None and len(aliases):
+            pairs = pd.DataFrame({
+                "key": aliases["alias"].astype(str).str.strip().str.upper(),
+                "code": exact.get_indexer(aliases["approvedSymbol"].astype(str)),
+            }).drop_duplicates()
+            pairs = pairs[(pairs["code"] >= 0) & (pairs["key"] != "") & ~pairs["key"].isin(upper)]
+            pairs = pairs[~pairs["key"].duplicated(keep=False)].sort_values("key")
+            alias_keys = pairs["key"]
+            alias_codes = pairs["code"].to_numpy(dtype=np.int64)
+
+        return cls(
+            symbols=symbols,
+            exact=exact,
+            upper=pd.Index(upper[unambiguous]),
+            upper_codes=np.flatnonzero(unambiguous),
+            aliases=pd.Index(alias_keys),
+            alias_codes=alias_codes,
+        )
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def encode(self, symbols: pd.Series) -> np.ndarray:
+        """Codes of already stripped symbols; -1 for symbols that are not approved."""
+        codes = self.exact.get_indexer(symbols)
+        missing = np.flatnonzero(codes < 0)
+        if len(missing):
+            upper_pos = self.upper.get_indexer(symbols.iloc[missing].str.upper())
+            found = upper_pos >= 0
+            codes[missing[found]] = self.upper_codes[upper_pos[found]]
+        return codes
+
+    def encode_aliases(self, symbols: pd.Series) -> np.ndarray:
+        """Codes of the approved symbols named by stripped aliases (any case); -1 if unknown."""
+        if len(self.aliases) == 0 or len(symbols) == 0:
+            return np.full(len(symbols), -1, dtype=np.int64)
+        pos = self.aliases.get_indexer(symbols.str.upper())
+        return np.where(pos >= 0, self.alias_codes[pos], -1)
+
+
+# --- Caches ---
+_approved_symbols_cache: set[str] | None = None
+_approved_symbols_lock = threading.Lock()
+_symbol_aliases_cache: pd.DataFrame | None = None
+_symbol_aliases_lock = threading.Lock()
+_vocabulary: SymbolVocabulary | None = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_approved_symbols_from_gcs() -> set[str]:
+    """
+    Read approvedSymbol column from Open Targets target parquet files in GCS using gcsfs.
+    Returns a set of approved gene symbols. Result is cached for the lifetime of the process.
+    """
+    global _approved_symbols_cache
+    if _approved_symbols_cache is not None:
+        return _approved_symbols_cache
+
+    with _approved_symbols_lock:
+        # Double-check after acquiring lock
+        if _approved_symbols_cache is not None:
+            return _approved_symbols_cache
+
+        fs = gcsfs.GCSFileSystem()
+        gcs_path = f"{OT_RELEASE_GCS_PATH}/target/"
+        df = pd.read_parquet(gcs_path, filesystem=fs, columns=["approvedSymbol"])
+        approved_symbols = set(df["approvedSymbol"].dropna().astype(str))
+        logger.info("Fetched %d approved symbols from GCS (cached for instance lifetime)", len(approved_symbols))
+        _approved_symbols_cache = approved_symbols
+        return approved_symbols
+
+
+def get_symbol_aliases_from_gcs() -> pd.DataFrame:
+    """
+    Read synonyms and obsolete symbols of every target from the Open Targets target
+    parquet files in GCS. Returns 'alias' and 'approvedSymbol' columns, one row per
+    pair. Result is cached for the lifetime of the process.
+    """
+    global _symbol_aliases_cache
+    if _symbol_aliases_cache is not None:
+        return _symbol_aliases_cache
+
+    with _symbol_aliases_lock:
+        if _symbol_aliases_cache is not None:
+            return _symbol_aliases_cache
+
+        fs = gcsfs.GCSFileSystem()
+        gcs_path = f"{OT_RELEASE_GCS_PATH}/target/"
+        df = pd.read_parquet(gcs_path, filesystem=fs, columns=["approvedSymbol", *ALIAS_COLUMNS])
+        pairs = []
+        for column in ALIAS_COLUMNS:
+            exploded = df[["approvedSymbol", column]].explode(column).dropna()
+            pairs.append(pd.DataFrame({
+                "alias": exploded[column].str.get("label"),
+                "approvedSymbol": exploded["approvedSymbol"],
+            }))
+        aliases = pd.concat(pairs, ignore_index=True).dropna().astype(str)
+        logger.info("Fetched %d symbol aliases from GCS (cached for instance lifetime)", len(aliases))
+        _symbol_aliases_cache = aliases
+        return aliases
+
+
+def get_symbol_vocabulary() -> SymbolVocabulary:
+    """Return the process-wide vocabulary of approved symbols, building it on first use."""
+    global _vocabulary
+    if _vocabulary is not None:
+        return _vocabulary
+    with _vocabulary_lock:
+        if _vocabulary is None:
+            try:
+                aliases = get_symbol_aliases_from_gcs()
+            except Exception as exc:  # noqa: BLE001
+                # Aliases only widen matching; exact and case-insensitive lookups still work
+                logger.warning("Symbol aliases unavailable, matching approved symbols only: %s", exc)
+                aliases = None
+            _vocabulary = SymbolVocabulary.build(get_approved_symbols_from_gcs(), aliases)
+            logger.info(
+                "Built symbol vocabulary (%d approved symbols, %d aliases)",
+                len(_vocabulary), len(_vocabulary.aliases),
+            )
+        return _vocabulary
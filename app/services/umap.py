@@ -0,0 +1,312 @@
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Per-disease embedding written by the UMAP/clustering pipeline:
+#   {UMAP_DATA_DIR}/{embedding}/diseaseId={diseaseId}/input_mtx_dim_neig_dist.tsv
+EMBEDDING_FILE = "input_mtx_dim_neig_dist.tsv"
+NOISE_CLUSTER = -1
+
+# Bit of each target flag in the 'flags' column; flags are kept even when downsampling
+FLAG_BITS = {
+    "prioritised": 1 << 0,
+    "geneticAD": 1 << 1,
+    "isDrugTarget": 1 << 2,
+    "neuroFluxTarget": 1 << 3,
+}
+
+EMBEDDING_SCHEMA = pa.schema([
+    ("symbol", pa.string()),
+    ("x", pa.float32()),
+    ("y", pa.float32()),
+    ("cluster", pa.int32()),
+    ("flags", pa.uint8()),
+])
+
+# Grid cells per axis at zoom 0; each zoom level doubles the resolution
+BASE_GRID_SIZE = 64
+MAX_ZOOM = 10
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_.:-]+$")
+
+
+@dataclass(frozen=True)
+class UmapEmbedding:
+    """Column arrays of one disease embedding, backed by a memory-mapped Arrow file."""
+
+    table: pa.Table
+    x: np.ndarray  # float32
+    y: np.ndarray  # float32
+    cluster: np.ndarray  # int32 cluster code, -1 for noise
+    flags: np.ndarray  # uint8 bitmask, see FLAG_BITS
+    cluster_names: dict[int, str]
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+
+def convert_embedding(tsv_path: Path, arrow_path: Path) -> None:
+    """Convert a pipeline TSV into the compact Arrow IPC file served by the API."""
+    metadata = pd.read_csv(tsv_path, sep="\t")
+
+    flags = np.zeros(len(metadata), dtype=np.uint8)
+    for column, bit in FLAG_BITS.items():
+        if column in metadata.columns:
+            flags |= np.where(metadata[column].fillna(0).astype(int) != 0, bit, 0).astype(np.uint8)
+
+    cluster = metadata["cluster"].fillna(NOISE_CLUSTER).astype(np.int32)
+    cluster_names = {}
+    if "clusterNameReactome" in metadata.columns:
+        named = metadata.loc[cluster != NOISE_CLUSTER].drop_duplicates("cluster")
+        cluster_names = {
+            int(c): str(name) for c, name in zip(named["cluster"], named["clusterNameReactome"])
+        }
+    cluster_names[NOISE_CLUSTER] = "Noise"
+
+    table = pa.Table.from_arrays(
+        [
+            pa.array(metadata["approvedSymbol"].astype(str), pa.string()),
+            pa.array(metadata["UMAP 1"].to_numpy(np.float32)),
+            pa.array(metadata["UMAP 2"].to_numpy(np.float32)),
+            pa.array(cluster.to_numpy()),
+            pa.array(flags),
+        ],
+        schema=EMBEDDING_SCHEMA.with_metadata({
+            "cluster_names": json.dumps(cluster_names),
+            "flag_bits": json.dumps(FLAG_BITS),
+        }),
+    )
+    # Unique temp name: several workers may convert the same embedding at once
+    with tempfile.NamedTemporaryFile(
+        dir=arrow_path.parent, prefix=f".{arrow_path.name}.", delete=False
+    ) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, arrow_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _is_stale(tsv_path: Path, arrow_path: Path) -> bool:
+    return not arrow_path.exists() or arrow_path.stat().st_mtime < tsv_path.stat().st_mtime
+
+
+def convert_all_embeddings(root: Path) -> int:
+    """
+    Convert every pipeline TSV under `root` whose Arrow file is missing or stale.
+
+    Run at deploy time (see app.scripts.precompute_gsea --umap-dir) so that workers
+    only ever memory-map existing files.
+
+    Returns:
+        Number of embeddings converted
+    """
+    converted = 0
+    for tsv_path in sorted(Path(root).glob(f"*/diseaseId=*/{EMBEDDING_FILE}")):
+        arrow_path = tsv_path.with_suffix(".arrow")
+        if _is_stale(tsv_path, arrow_path):
+            convert_embedding(tsv_path, arrow_path)
+            converted += 1
+    return converted
+
+
+def _load_embedding(arrow_path: Path) -> UmapEmbedding:
+    # Zero-copy: numpy views reference the mapped file
+    table = pa.ipc.open_file(pa.memory_map(str(arrow_path), "r")).read_all()
+    table = table.combine_chunks()
+    cluster_names = json.loads(table.schema.metadata[b"cluster_names"])
+    return UmapEmbedding(
+        table=table,
+        x=table.column("x").chunk(0).to_numpy(),
+        y=table.column("y").chunk(0).to_numpy(),
+        cluster=table.column("cluster").chunk(0).to_numpy(),
+        flags=table.column("flags").chunk(0).to_numpy(),
+        cluster_names={int(k): v for k, v in cluster_names.items()},
+    )
+
+
+class UmapStore:
+    """
+    Per-disease UMAP embeddings, converted once from the pipeline TSV to an Arrow file
+    next to it and memory-mapped on first use. Embeddings not converted ahead of time
+    (convert_all_embeddings) are converted on first request.
+
+    Loaded embeddings are kept with the mtime of their TSV, and the embedding list
+    with the mtime of the root directory; both are checked on every access, so a
+    replaced TSV or a new embedding directory is picked up without a restart.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._embeddings: dict[tuple[str, str], tuple[int, UmapEmbedding]] = {}
+        self._names: list[str] = []
+        self._root_mtime: int | None = None
+        self._lock = threading.Lock()
+
+    def embeddings(self) -> list[str]:
+        try:
+            mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._root_mtime:
+            return self._names
+        with self._lock:
+            if mtime != self._root_mtime:
+                names = [] if mtime is None else sorted(
+                    d.name for d in self.root.iterdir() if d.is_dir()
+                )
+                # Names first, so a reader never pairs the new mtime with the old list
+                self._names = names
+                self._root_mtime = mtime
+            return self._names
+
+    def get(self, embedding: str, disease_id: str) -> UmapEmbedding | None:
+        """
+        Return the embedding of a disease, or None if it has not been computed.
+
+        Raises:
+            ValueError: If embedding is unknown or disease_id is malformed
+        """
+        if embedding not in self.embeddings():
+            raise ValueError("Invalid embedding. Choose from: " + str(self.embeddings()))
+        if not _SAFE_NAME.match(disease_id):
+            raise ValueError(f"Invalid disease ID: {disease_id!r}")
+
+        key = (embedding, disease_id)
+        tsv_path = self.root / embedding / f"diseaseId={disease_id}" / EMBEDDING_FILE
+        try:
+            mtime = tsv_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._embeddings.pop(key, None)
+            return None
+        cached = self._embeddings.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with self._lock:
+            cached = self._embeddings.get(key)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            arrow_path = tsv_path.with_suffix(".arrow")
+            # A TSV replaced since it was loaded may still be older than its Arrow file
+            if cached is not None or _is_stale(tsv_path, arrow_path):
+                convert_embedding(tsv_path, arrow_path)
+                logger.info("Converted UMAP embedding %s/%s to %s", embedding, disease_id, arrow_path)
+
+            # Earlier mappings stay valid for in-flight requests: the Arrow file is
+            # swapped in by rename
+            loaded = _load_embedding(arrow_path)
+            self._embeddings[key] = (mtime, loaded)
+            return loaded
+
+
+def select_points(
+    emb: UmapEmbedding,
+    zoom: int | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+) -> np.ndarray:
+    """
+    Indices of the points to send, in original order.
+
+    Args:
+        emb: Embedding to select from
+        zoom: If given, keep one point per cell of a grid with
+            BASE_GRID_SIZE * 2**zoom cells per axis over the viewport. Flagged
+            points are always kept.
+        bbox: Optional viewport (x_min, y_min, x_max, y_max); points outside are dropped
+
+    Raises:
+        ValueError: If zoom or bbox is out of range
+    """
+    keep = np.ones(len(emb), dtype=bool)
+    if bbox is not None:
+        x_min, y_min, x_max, y_max = bbox
+        if x_min >= x_max or y_min >= y_max:
+            raise ValueError("bbox must be x_min,y_min,x_max,y_max with min < max")
+        keep = (emb.x >= x_min) & (emb.x <= x_max) & (emb.y >= y_min) & (emb.y <= y_max)
+    idx = np.flatnonzero(keep)
+    if zoom is None or len(idx) == 0:
+        return idx
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+
+    x, y = emb.x[idx], emb.y[idx]
+    if bbox is None:
+        x_min, x_max = float(x.min()), float(x.max())
+        y_min, y_max = float(y.min()), float(y.max())
+    grid = BASE_GRID_SIZE << zoom
+    # Degenerate extents collapse to a single cell on that axis
+    col = ((x - x_min) / max(x_max - x_min, 1e-12) * (grid - 1)).astype(np.int64)
+    row = ((y - y_min) / max(y_max - y_min, 1e-12) * (grid - 1)).astype(np.int64)
+    _, first = np.unique(row * grid + col, return_index=True)
+
+    sampled = np.zeros(len(idx), dtype=bool)
+    sampled[first] = True
+    sampled |= emb.flags[idx] != 0
+    return idx[sampled]
+
+
+def _metadata(emb: UmapEmbedding, idx: np.ndarray) -> dict:
+    return {
+        "count": int(len(idx)),
+        "total": len(emb),
+        "clusters": {str(k): v for k, v in sorted(emb.cluster_names.items())},
+        "flag_bits": FLAG_BITS,
+    }
+
+
+def to_arrow_stream(emb: UmapEmbedding, idx: np.ndarray) -> bytes:
+    """Selected points as an Arrow IPC stream; cluster names and flag bits are in the schema metadata."""
+    table = emb.table.take(pa.array(idx))
+    meta = {k: json.dumps(v) for k, v in _metadata(emb, idx).items()}
+    table = table.replace_schema_metadata(meta)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_columnar(emb: UmapEmbedding, idx: np.ndarray) -> dict:
+    """Selected points as a JSON object of parallel arrays."""
+    table = emb.table.take(pa.array(idx))
+    return {
+        **_metadata(emb, idx),
+        "symbol": table.column("symbol").to_pylist(),
+        "x": emb.x[idx].tolist(),
+        "y": emb.y[idx].tolist(),
+        "cluster": emb.cluster[idx].tolist(),
+        "flags": emb.flags[idx].tolist(),
+    }
+
+
+_store: UmapStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_umap_store() -> UmapStore:
+    """Return the process-wide store for the configured UMAP_DATA_DIR."""
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            _store = UmapStore(get_config().UMAP_DATA_DIR)
+        return _store
@@ -10,7 +10,7 @@ def validate_gsea_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         df: Input DataFrame to validate
 
     Returns:
-        Normalized DataFrame with 'symbol' and 'globalScore' columns, sorted by score
+        DataFrame with only the 'symbol' and 'globalScore' columns
 
     Raises:
         HTTPException: If validation fails
@@ -26,11 +26,8 @@ def validate_gsea_dataframe(df: pd.DataFrame) -> pd.DataFrame:
             detail="Input must contain 'symbol' and 'globalScore' columns",
         )
 
-    # Extract only required columns and sort
-    df = df[["symbol", "globalScore"]].copy()
-    df = df.sort_values("globalScore", ascending=False)
-
-    return df
+    # Extract only required columns; ranking happens once when the signature is built
+    return df[["symbol", "globalScore"]]
 
 
 def handle_gsea_error(error: Exception) -> HTTPException:
@@ -0,0 +1,39 @@
+"""
+Gunicorn configuration for the multi-worker deployment mode.
+
+The app is imported once in the master (preload_app) and library data is loaded
+before workers are forked, so workers share it copy-on-write rather than each
+holding a copy. Enabled by start.sh when WEB_CONCURRENCY > 1.
+"""
+
+import gc
+import logging
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# GSEA runs on large libraries can take well over gunicorn's 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    """Runs in the master after the app is preloaded and before any worker is forked."""
+    from app.scripts.prepare_gene_lists import generate_all_library_gene_lists
+    from app.services.gsea import preload_shared_data
+
+    logger = logging.getLogger("gunicorn.error")
+    try:
+        generate_all_library_gene_lists()
+        names = preload_shared_data()
+        logger.info("Preloaded shared data for libraries: %s", ", ".join(names))
+    except Exception as exc:  # noqa: BLE001
+        # Workers fall back to loading lazily
+        logger.exception("Failed to preload shared data: %s", exc)
+
+    # Move everything allocated so far out of the GC's reach so collections in the
+    # workers do not write to (and so copy) the shared pages
+    gc.freeze()
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from app.services.cache import ResultCache, estimate_result_size
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=300, policy="lru")
+    for key in ("a", "b", "c"):
+        assert cache.put(key, key.upper(), 100)
+    assert cache.get("a") == "A"
+
+    cache.put("d", "D", 100)
+    assert "b" not in cache
+    assert all(key in cache for key in ("a", "c", "d"))
+
+
+def test_lfu_evicts_least_frequently_used_then_least_recent():
+    cache = ResultCache(max_bytes=300, policy="lfu")
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper(), 100)
+    cache.get("a")
+    cache.get("c")
+    cache.get("c")
+
+    cache.put("d", "D", 100)
+    assert "b" not in cache
+    # a and d now tie on two uses; a was used less recently
+    cache.get("d")
+    cache.put("e", "E", 100)
+    assert "a" not in cache
+    assert all(key in cache for key in ("c", "d", "e"))
+
+
+def test_evicts_until_new_entry_fits_and_counts_bytes():
+    cache = ResultCache(max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, 100)
+    cache.put("big", "big", 250)
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["bytes"] == 250 and stats["evictions"] == 3
+
+    # Replacing an entry releases its old size
+    cache.put("big", "big", 200)
+    cache.put("a", "a", 100)
+    assert cache.stats()["bytes"] == 300 and "big" in cache
+
+    cache.clear()
+    assert cache.stats()["bytes"] == 0 and cache.stats()["entries"] == 0
+
+
+def test_entries_larger_than_budget_are_not_cached():
+    cache = ResultCache(max_bytes=100)
+    cache.put("a", "a", 60)
+    assert not cache.put("big", "big", 101)
+    assert "a" in cache and "big" not in cache
+    assert cache.stats()["bytes"] == 60
+
+
+def test_hit_ratio_and_unknown_policy():
+    cache = ResultCache(max_bytes=100)
+    cache.put("a", "a", 10)
+    cache.get("a")
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+    with pytest.raises(ValueError):
+        ResultCache(max_bytes=100, policy="fifo")
+
+
+def test_result_size_counts_string_payloads():
+    short = pd.DataFrame({"Leading edge genes": ["A"] * 10})
+    long = pd.DataFrame({"Leading edge genes": ["A," * 500] * 10})
+    stats = {"library": "Reactome"}
+    assert estimate_result_size(long, stats) > estimate_result_size(short, stats) + 9000
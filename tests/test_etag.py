@@ -0,0 +1,20 @@
+from app.routers.gsea import _matching_etag
+
+ETAGS = ['W/"abc-two_sided"', 'W/"def-two_sided"']
+
+
+def test_no_header_never_matches():
+    assert _matching_etag(None, ETAGS) is None
+    assert _matching_etag("", ETAGS) is None
+
+
+def test_weak_comparison_in_a_list():
+    assert _matching_etag('"def-two_sided"', ETAGS) == ETAGS[1]
+    assert _matching_etag('"x", W/"abc-two_sided"', ETAGS) == ETAGS[0]
+    assert _matching_etag('"abc-one_sided_positive"', ETAGS) is None
+
+
+def test_wildcard_matches_current_representation():
+    assert _matching_etag("*", ETAGS) == ETAGS[0]
+    assert _matching_etag('"x", *', ETAGS) == ETAGS[0]
+    assert _matching_etag("*", []) is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import symbols
+from app.services.gsea import _prepare_signature, match_symbols
+from app.services.library import LibraryCatalogue
+from app.services.symbols import SymbolVocabulary
+
+
+@pytest.fixture
+def vocabulary(monkeypatch):
+    aliases = pd.DataFrame({"alias": ["CARD15"], "approvedSymbol": ["NOD2"]})
+    vocabulary = SymbolVocabulary.build(["BRCA1", "EGFR", "KRAS", "MYC", "NOD2", "TP53"], aliases)
+    monkeypatch.setattr(symbols, "_vocabulary", vocabulary)
+    return vocabulary
+
+
+@pytest.fixture
+def library(tmp_path):
+    folder = tmp_path / "Lib"
+    folder.mkdir()
+    sets = {"Set A": ["TP53", "EGFR", "BRCA1"], "Set B": ["NOD2", "MYC", "KRAS", "TP53"]}
+    lines = [f"{term}\tdescription\t" + "\t".join(members) for term, members in sets.items()]
+    (folder / "Lib_2025.gmt").write_text("\n".join(lines) + "\n")
+    return LibraryCatalogue(tmp_path).get("Lib/Lib_2025")
+
+
+def test_match_symbols_exact_then_case_then_aliases(vocabulary):
+    codes, counts = match_symbols(pd.Series(["TP53", "tp53", "card15", "UNKNOWN"]))
+    assert list(vocabulary.symbols[codes[:3]]) == ["TP53", "TP53", "NOD2"]
+    assert codes[3] == -1
+    assert counts == {"case_remapped_count": 1, "remapped_count": 1}
+
+
+def test_prepare_signature_ranks_matched_input_and_pads_background(vocabulary, library):
+    df = pd.DataFrame({
+        "symbol": [" tp53", "CARD15", "EGFR", "EGFR", "UNKNOWN", "BRCA1"],
+        "globalScore": [2.0, 1.0, -1.0, 3.0, 5.0, 0.0],
+    })
+    signature, overlap = _prepare_signature(df, library, "Lib/Lib_2025")
+
+    # Duplicates keep their highest score; ties keep input order, then background
+    # genes missing from the input follow alphabetically at score 0
+    assert list(signature["symbol"]) == ["EGFR", "TP53", "NOD2", "BRCA1", "KRAS", "MYC"]
+    np.testing.assert_array_equal(signature["globalScore"], [3.0, 2.0, 1.0, 0.0, 0.0, 0.0])
+    assert overlap["matched_count"] == 4
+    assert overlap["case_remapped_count"] == 1
+    assert overlap["remapped_count"] == 1
+    # Verbatim matches against the background only: EGFR and BRCA1
+    assert (overlap["used_count"], overlap["total_input"]) == (2, 5)
+
+
+def test_prepare_signature_requires_columns(vocabulary, library):
+    with pytest.raises(ValueError):
+        _prepare_signature(pd.DataFrame({"symbol": ["TP53"]}), library, "Lib/Lib_2025")
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from app.services.library import LibraryCatalogue
+
+
+def _write_gmt(folder, sets: dict[str, list[str]]) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    lines = [f"{term}\tdescription\t" + "\t".join(genes) for term, genes in sets.items()]
+    (folder / "Lib_2025.gmt").write_text("\n".join(lines) + "\n")
+
+
+SETS = {"T1{ID1}": ["A", "B", "C"], "T2{ID2}": ["B", "C", "D", "E"]}
+
+
+def test_versions_are_content_hashes(tmp_path):
+    _write_gmt(tmp_path / "Lib", SETS)
+    first = LibraryCatalogue(tmp_path).get("Lib/Lib_2025")
+    # Another process (or a restart) sees the same version for the same files
+    assert LibraryCatalogue(tmp_path).get("Lib/Lib_2025").versioned_name == first.versioned_name
+    assert first.versioned_name.startswith("Lib/Lib_2025@v")
+    assert list(first.universe) == ["A", "B", "C", "D", "E"]
+
+
+def test_refresh_swaps_changed_library(tmp_path):
+    _write_gmt(tmp_path / "Lib", SETS)
+    catalogue = LibraryCatalogue(tmp_path)
+    old = catalogue.get("Lib/Lib_2025")
+
+    # Touching without changing the content keeps the version
+    gmt = tmp_path / "Lib" / "Lib_2025.gmt"
+    os.utime(gmt, ns=(gmt.stat().st_atime_ns, gmt.stat().st_mtime_ns + 10**9))
+    assert catalogue.refresh() == []
+
+    _write_gmt(tmp_path / "Lib", {**SETS, "T3{ID3}": ["E", "F"]})
+    os.utime(gmt, ns=(gmt.stat().st_atime_ns, gmt.stat().st_mtime_ns + 2 * 10**9))
+    assert catalogue.refresh() == ["Lib/Lib_2025"]
+    new = catalogue.get("Lib/Lib_2025")
+    assert new.versioned_name != old.versioned_name
+    # The background is regenerated for the new GMT
+    assert "F" in new.universe
+
+    with pytest.raises(ValueError):
+        catalogue.get(old.versioned_name)
+
+
+def test_leased_version_stays_available_until_released(tmp_path):
+    _write_gmt(tmp_path / "Lib", SETS)
+    catalogue = LibraryCatalogue(tmp_path)
+    gmt = tmp_path / "Lib" / "Lib_2025.gmt"
+
+    with catalogue.lease("Lib/Lib_2025") as old:
+        _write_gmt(tmp_path / "Lib", {**SETS, "T3{ID3}": ["E", "F"]})
+        os.utime(gmt, ns=(gmt.stat().st_atime_ns, gmt.stat().st_mtime_ns + 10**9))
+        catalogue.refresh()
+        assert catalogue.get(old.versioned_name) is old
+        assert catalogue.stats()["leases"] == {old.versioned_name: 1}
+
+    assert old.versioned_name not in catalogue.stats()["loaded"]
+    with pytest.raises(ValueError):
+        catalogue.get(old.versioned_name)
+
+
+def test_unknown_library(tmp_path):
+    with pytest.raises(ValueError):
+        LibraryCatalogue(tmp_path).get("Nope/Nope")
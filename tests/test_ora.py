@@ -0,0 +1,46 @@
+import numpy as np
+from scipy.stats import hypergeom
+
+from app.services import ora, symbols
+from app.services.library import LibraryCatalogue
+from app.services.ora import hypergeom_upper_tail
+from app.services.symbols import SymbolVocabulary
+
+
+def test_hypergeom_upper_tail_matches_scipy():
+    rng = np.random.default_rng(0)
+    n_universe, n_draws = 20000, 150
+    n = rng.integers(5, 4000, size=200)
+    k = np.minimum(rng.integers(0, 40, size=200), n)
+
+    expected = hypergeom.sf(k - 1, n_universe, n, n_draws)
+    np.testing.assert_allclose(hypergeom_upper_tail(k, n_universe, n, n_draws), expected, rtol=1e-9)
+
+
+def test_hypergeom_upper_tail_edges():
+    # k = 0 is certain; k beyond min(set size, draws) is impossible
+    pvals = hypergeom_upper_tail(np.array([0, 11, 6]), 100, np.array([10, 10, 10]), 5)
+    np.testing.assert_allclose(pvals, [1.0, 0.0, 0.0])
+    assert len(hypergeom_upper_tail(np.array([], dtype=int), 100, np.array([], dtype=int), 5)) == 0
+
+
+def test_run_ora_returns_hierarchy_libraries_most_significant_first(tmp_path, monkeypatch):
+    genes = [f"G{i}" for i in range(100)]
+    folder = tmp_path / "Lib"
+    folder.mkdir()
+    # ID order (A1, B1) is the reverse of significance order
+    sets = {"Weak{A1}": genes[:20], "Strong{B1}": genes[20:40]}
+    lines = [f"{term}\tdescription\t" + "\t".join(members) for term, members in sets.items()]
+    (folder / "Lib_2025.gmt").write_text("\n".join(lines) + "\n")
+    (folder / "Lib_hierarchy.txt").write_text("B1\tA1\n")
+    library = LibraryCatalogue(tmp_path).get("Lib/Lib_2025")
+    monkeypatch.setattr(ora, "get_library", lambda name: library)
+    monkeypatch.setattr(symbols, "_vocabulary", SymbolVocabulary.build(genes))
+
+    res_df, overlap = ora.run_ora(genes[19:30], "Lib/Lib_2025")
+
+    assert list(res_df["ID"]) == ["B1", "A1"]
+    assert res_df["p-value"].is_monotonic_increasing
+    assert list(res_df["Parent pathway"]) == ["", "B1"]
+    assert list(res_df["Number of input genes"]) == [10, 1]
+    assert overlap["matched_count"] == 11
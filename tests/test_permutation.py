@@ -0,0 +1,66 @@
+import blitzgsea as blitz
+import numpy as np
+import pandas as pd
+
+from app.services.permutation import (
+    _chunk_sizes, _sample_without_replacement, null_enrichment_scores, permutation_gsea,
+)
+from app.services.rerank import rank_signature
+
+
+def _signature(n_genes: int = 500, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "symbol": [f"G{i}" for i in range(n_genes)],
+        "globalScore": rng.normal(size=n_genes),
+    })
+
+
+def test_null_enrichment_scores_match_blitzgsea():
+    ranked, abs_signature, signature_map = rank_signature(_signature())
+    genes = ranked.index.to_numpy()
+    rng = np.random.default_rng(1)
+    for k in (5, 37, 200):
+        positions = np.sort(
+            np.stack([rng.choice(len(genes), k, replace=False) for _ in range(10)]), axis=1
+        )
+        expected = [
+            blitz.enrichment_score(abs_signature, signature_map, list(genes[p]))[1]
+            for p in positions
+        ]
+        np.testing.assert_allclose(
+            null_enrichment_scores(abs_signature, positions), expected, atol=1e-12
+        )
+
+
+def test_samples_are_distinct_and_uniform():
+    # Sparse draws from a stream with replacement, and dense draws by random keys
+    for n_total, k in ((2000, 5), (2000, 300), (100, 80)):
+        sample = _sample_without_replacement(np.random.default_rng(0), n_total, k, 2000)
+        assert sample.shape == (2000, k)
+        assert sample.min() >= 0 and sample.max() < n_total
+        assert all(len(np.unique(row)) == k for row in sample)
+        np.testing.assert_array_equal(
+            sample, _sample_without_replacement(np.random.default_rng(0), n_total, k, 2000)
+        )
+        # Every position is equally likely to be drawn first
+        counts = np.bincount(sample[:, 0] * 10 // n_total, minlength=10)
+        assert counts.min() > 150 and counts.max() < 250
+
+
+def test_chunk_sizes_are_contiguous_and_complete():
+    sizes = [5, 6, 7, 10, 20, 50, 100, 400]
+    chunks = _chunk_sizes(sizes, 3)
+    assert [size for chunk in chunks for size in chunk] == sizes
+    assert len(chunks) <= 3
+    assert _chunk_sizes([5], 4) == [[5]]
+
+
+def test_permutation_gsea_is_seeded():
+    signature = _signature()
+    library_sets = {f"S{i}": [f"G{j}" for j in range(i, i + 5 + i % 40)] for i in range(0, 400, 7)}
+
+    first = permutation_gsea(signature, library_sets, n_perm=200, seed=3)
+    again = permutation_gsea(signature, library_sets, n_perm=200, seed=3)
+    pd.testing.assert_frame_equal(first, again)
+    assert first["pval"].between(0, 1).all()
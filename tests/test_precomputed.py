@@ -0,0 +1,110 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.services.precomputed import (
+    RESULT_COLUMNS,
+    PrecomputedLibraryWriter,
+    PrecomputedStore,
+    write_manifest,
+)
+
+
+def _results(disease_id: str, n_terms: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "ID": [f"R-{i}" for i in range(n_terms)],
+        "Link": [f"https://reactome.org/content/detail/R-{i}" for i in range(n_terms)],
+        "Pathway": [f"Pathway {i}" for i in range(n_terms)],
+        "ES": [0.5 + i for i in range(n_terms)],
+        "NES": [1.5 + i for i in range(n_terms)],
+        "FDR": [0.01] * n_terms,
+        "p-value": [0.001] * n_terms,
+        "Sidak's p-value": [0.02] * n_terms,
+        "Number of input genes": [3] * n_terms,
+        "Leading edge genes": [f"{disease_id}_A,{disease_id}_B"] * n_terms,
+        "Pathway size": [10] * n_terms,
+        "Pathway genes": ["A,B,C"] * n_terms,
+        "Parent pathway": [""] * n_terms,
+    })[RESULT_COLUMNS]
+
+
+LIBRARY = "Reactome/ReactomePathways_2025"
+# Overlap stats as returned by the live analysis
+OVERLAP = {
+    "library": LIBRARY,
+    "library_version": f"{LIBRARY}@v0123456789ab",
+    "used_count": 3,
+    "total_input": 4,
+    "used_percent": 75.0,
+    "matched_count": 4,
+    "matched_percent": 100.0,
+    "case_remapped_count": 1,
+    "remapped_count": 0,
+}
+
+
+def _write_store(root, release: str, diseases: dict[str, int]) -> None:
+    writer = PrecomputedLibraryWriter(root, "Reactome/ReactomePathways_2025")
+    for disease_id, n_terms in sorted(diseases.items()):
+        writer.add(disease_id, _results(disease_id, n_terms), OVERLAP)
+    write_manifest(root, release, {"Reactome/ReactomePathways_2025": writer.close()})
+
+
+def test_round_trip(tmp_path):
+    _write_store(tmp_path, "25.09", {"EFO_1": 2, "EFO_2": 3})
+    store = PrecomputedStore(tmp_path)
+    assert store.release == "25.09"
+
+    res_df, overlap = store.lookup("EFO_2", LIBRARY)
+    pd.testing.assert_frame_equal(res_df, _results("EFO_2", 3))
+    assert overlap == OVERLAP
+    assert store.manifest["libraries"][LIBRARY]["library_version"] == OVERLAP["library_version"]
+    assert store.lookup("EFO_3", "Reactome/ReactomePathways_2025") is None
+    with pytest.raises(ValueError):
+        store.lookup("EFO_1", "GO molecular function/GO:MF_2025")
+
+
+def test_new_manifest_is_picked_up(tmp_path):
+    store = PrecomputedStore(tmp_path)
+    assert store.release is None
+
+    _write_store(tmp_path, "25.06", {"EFO_1": 1})
+    assert store.release == "25.06"
+    assert store.lookup("EFO_2", "Reactome/ReactomePathways_2025") is None
+
+    _write_store(tmp_path, "25.09", {"EFO_1": 1, "EFO_2": 2})
+    manifest = tmp_path / "manifest.json"
+    stat = manifest.stat()
+    os.utime(manifest, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert store.release == "25.09"
+    assert len(store.lookup("EFO_2", "Reactome/ReactomePathways_2025")[0]) == 2
+
+
+def test_store_without_all_overlap_stats(tmp_path):
+    _write_store(tmp_path, "25.06", {"EFO_1": 1})
+    # Index of a store written before the matching stats were kept
+    index_path = tmp_path / "Reactome__ReactomePathways_2025.index.arrow"
+    with pa.OSFile(str(index_path)) as source:
+        index = pa.ipc.open_file(source).read_all()
+    index = index.select(["diseaseId", "offset", "length", "used_count", "total_input", "used_percent"])
+    with pa.OSFile(str(index_path), "wb") as sink:
+        with pa.ipc.new_file(sink, index.schema) as writer:
+            writer.write_table(index)
+
+    _, overlap = PrecomputedStore(tmp_path).lookup("EFO_1", LIBRARY)
+    assert overlap == {
+        "library": LIBRARY,
+        "library_version": OVERLAP["library_version"],
+        "used_count": 3,
+        "total_input": 4,
+        "used_percent": 75.0,
+    }
+
+
+def test_writer_rejects_results_of_another_library_version(tmp_path):
+    writer = PrecomputedLibraryWriter(tmp_path, LIBRARY)
+    writer.add("EFO_1", _results("EFO_1", 1), OVERLAP)
+    with pytest.raises(ValueError):
+        writer.add("EFO_2", _results("EFO_2", 1), {**OVERLAP, "library_version": f"{LIBRARY}@vnew"})
@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.scripts.replay_load import build_report, format_report
+
+TRACE = [
+    {"method": "POST", "path": "/api/gsea/analyze/json", "params": {"gmt_name": "Reactome"}},
+    {"method": "POST", "path": "/api/gsea/analyze/json", "params": {"gmt_name": "Reactome"}},
+    {"method": "POST", "path": "/api/gsea/analyze/json", "params": {"gmt_name": "GO"}},
+    {"path": "/api/gsea/libraries"},
+]
+
+
+def _report(statuses=(200, 304, 500, None), stats_after_pid=1, rss_before=100 * 2**20):
+    return build_report(
+        TRACE,
+        latencies=np.array([0.1, 0.3, 0.2, 0.05]),
+        statuses=list(statuses),
+        elapsed=2.0,
+        stats_before={"pid": 1, "hits": 10, "misses": 5},
+        stats_after={"pid": stats_after_pid, "hits": 13, "misses": 6, "entries": 4, "bytes": 2048},
+        rss_before=rss_before,
+        rss_after=150 * 2**20,
+        rss_peak=120 * 2**20,
+    )
+
+
+def test_build_report_summarises_status_latency_and_endpoints():
+    report = _report()
+    assert report["requests"] == 4
+    assert report["throughput_rps"] == 2.0
+    # 304 counts as success, transport errors as their own status
+    assert report["error_rate"] == 0.5
+    assert report["status_counts"] == {"200": 1, "304": 1, "500": 1, "error": 1}
+    assert report["latency"]["count"] == 4 and report["latency"]["max_ms"] == 300.0
+    assert report["by_endpoint"]["POST /api/gsea/analyze/json Reactome"]["count"] == 2
+    assert report["by_endpoint"]["GET /api/gsea/libraries"]["count"] == 1
+    assert "Requests:" in format_report(report)
+
+
+def test_build_report_cache_and_memory():
+    report = _report()
+    assert report["cache"] == {
+        "hits": 3, "misses": 1, "hit_ratio": 0.75, "pid": 1, "entries": 4, "bytes": 2048,
+    }
+    # The peak is never below the final reading
+    assert report["memory"]["rss_peak_mb"] == 150.0
+    assert report["memory"]["rss_growth_mb"] == 50.0
+
+    # Cache stats from two different workers cannot be compared; RSS may be unavailable
+    report = _report(stats_after_pid=2, rss_before=0)
+    assert report["cache"] is None
+    assert report["memory"] is None
@@ -0,0 +1,67 @@
+import blitzgsea as blitz
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.stats.multitest import multipletests
+
+from app.services.rerank import (
+    EngineState, _pdf_cache_key, cached_null_model, estimate_null_model, rank_signature, rerank,
+)
+
+
+def _inputs(n_genes: int = 500, n_sets: int = 40, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    genes = [f"G{i}" for i in range(n_genes)]
+    signature = pd.DataFrame({"symbol": genes, "globalScore": rng.normal(size=n_genes)})
+    library_sets = {
+        f"S{i}": list(rng.choice(genes, rng.integers(10, 80), replace=False))
+        for i in range(n_sets)
+    }
+    gene_to_terms: dict[str, tuple[str, ...]] = {}
+    for term, members in library_sets.items():
+        for gene in members:
+            gene_to_terms[gene] = gene_to_terms.get(gene, ()) + (term,)
+    return signature, library_sets, gene_to_terms
+
+
+def test_rerank_matches_full_run_for_affected_sets():
+    signature, library_sets, gene_to_terms = _inputs()
+    cached_null_model(signature, library_sets)
+    base = EngineState("lib", signature, blitz.gsea(signature, library_sets, processes=1))
+
+    new_signature = signature.copy()
+    new_signature.loc[:2, "globalScore"] = [5.0, -5.0, 0.0]
+    raw_df, _, stats = rerank(base, new_signature, library_sets, gene_to_terms, max_moved=50)
+    affected = sorted({term for gene in ("G0", "G1", "G2") for term in gene_to_terms.get(gene, ())})
+    assert stats == {"moved_genes": 3, "recomputed_sets": len(affected)}
+
+    # A full run of the new signature, scored with the same null model as the delta
+    blitz.pdf_cache[_pdf_cache_key(new_signature)] = blitz.pdf_cache[_pdf_cache_key(signature)]
+    full = blitz.gsea(new_signature, library_sets, processes=1)
+    assert sorted(raw_df.index) == sorted(full.index)
+    columns = ["es", "nes", "pval", "geneset_size"]
+    np.testing.assert_allclose(
+        raw_df.loc[affected, columns].astype(float), full.loc[affected, columns].astype(float),
+        atol=1e-12,
+    )
+    assert raw_df.loc[affected, "leading_edge"].tolist() == full.loc[affected, "leading_edge"].tolist()
+
+    # Other sets keep their base results; corrections are redone over every set
+    unaffected = raw_df.index.difference(affected)
+    pd.testing.assert_series_equal(
+        raw_df.loc[unaffected, "es"].astype(float), base.raw_results.loc[unaffected, "es"].astype(float)
+    )
+    np.testing.assert_allclose(raw_df["fdr"], multipletests(raw_df["pval"], method="fdr_bh")[1])
+
+
+def test_rerank_defers_to_full_run_when_many_genes_moved():
+    signature, library_sets, gene_to_terms = _inputs()
+    base = EngineState("lib", signature, pd.DataFrame())
+    new_signature = signature.assign(globalScore=signature["globalScore"] + 1)
+    assert rerank(base, new_signature, library_sets, gene_to_terms, max_moved=50) is None
+
+
+def test_null_model_of_empty_library():
+    ranked, abs_signature, signature_map = rank_signature(_inputs()[0])
+    with pytest.raises(ValueError, match="library is empty"):
+        estimate_null_model(ranked, abs_signature, signature_map, {})
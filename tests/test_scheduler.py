@@ -0,0 +1,60 @@
+import threading
+import time
+
+from app.services.scheduler import CpuScheduler
+
+
+def test_share_is_limited_to_unallocated_processes():
+    scheduler = CpuScheduler(cpu_budget=4, max_processes=2, max_jobs=4)
+    with scheduler.slot() as first:
+        with scheduler.slot() as second:
+            assert (first, second) == (2, 2)
+            assert scheduler.stats()["allocated"] == 4
+        with scheduler.slot() as third:
+            assert third == 2
+    assert scheduler.stats()["allocated"] == 0
+
+
+def test_job_waits_while_every_process_is_allocated():
+    scheduler = CpuScheduler(cpu_budget=4, max_processes=4, max_jobs=4)
+    shares = []
+
+    def job():
+        with scheduler.slot() as processes:
+            shares.append(processes)
+
+    with scheduler.slot() as first:
+        assert first == 4
+        waiting = threading.Thread(target=job)
+        waiting.start()
+        time.sleep(0.05)
+        assert shares == []
+    waiting.join(timeout=5)
+    assert shares == [4]
+
+
+def test_concurrent_jobs_never_exceed_budget():
+    scheduler = CpuScheduler(cpu_budget=4, max_processes=4, max_jobs=4)
+    lock = threading.Lock()
+    running: list[int] = []
+    totals: list[int] = []
+
+    def job(hold: float):
+        with scheduler.slot() as processes:
+            with lock:
+                running.append(processes)
+                totals.append(sum(running))
+            time.sleep(hold)
+            with lock:
+                running.remove(processes)
+
+    threads = [threading.Thread(target=job, args=(0.01 * (i % 3 + 1),)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(totals) == 12
+    assert max(totals) <= scheduler.cpu_budget
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.stats()["allocated"] == 0
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from app.services.symbols import SymbolVocabulary
+
+
+def _vocabulary() -> SymbolVocabulary:
+    aliases = pd.DataFrame({
+        "alias": ["NOD2A", "CARD15", "shared", "shared", "tp53"],
+        "approvedSymbol": ["NOD2", "NOD2", "NOD2", "TP53", "TP53"],
+    })
+    return SymbolVocabulary.build(["NOD2", "TP53", "C1orf1", "C1ORF1"], aliases)
+
+
+def test_encode_exact_then_case_insensitive():
+    vocabulary = _vocabulary()
+    codes = vocabulary.encode(pd.Series(["TP53", "tp53", "nod2", "UNKNOWN"]))
+    assert list(vocabulary.symbols[codes[:3]]) == ["TP53", "TP53", "NOD2"]
+    assert codes[3] == -1
+
+
+def test_ambiguous_case_is_not_matched():
+    vocabulary = _vocabulary()
+    codes = vocabulary.encode(pd.Series(["C1orf1", "C1ORF1", "c1orf1"]))
+    assert list(vocabulary.symbols[codes[:2]]) == ["C1orf1", "C1ORF1"]
+    assert codes[2] == -1
+
+
+def test_encode_aliases():
+    vocabulary = _vocabulary()
+    codes = vocabulary.encode_aliases(pd.Series(["card15", "NOD2A", "SHARED", "TP53", "x"]))
+    assert list(vocabulary.symbols[codes[:2]]) == ["NOD2", "NOD2"]
+    # Aliases naming several genes, or spelling an approved symbol, are dropped
+    np.testing.assert_array_equal(codes[2:], [-1, -1, -1])
+
+
+def test_encode_aliases_without_aliases():
+    vocabulary = SymbolVocabulary.build(["NOD2"])
+    np.testing.assert_array_equal(vocabulary.encode_aliases(pd.Series(["CARD15"])), [-1])
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.umap import EMBEDDING_FILE, UmapStore, convert_all_embeddings, select_points
+
+
+def _write_tsv(root, n, embedding="Reactome_v2", disease_id="EFO_0000094", seed=0):
+    rng = np.random.default_rng(seed)
+    folder = root / embedding / f"diseaseId={disease_id}"
+    folder.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        "approvedSymbol": [f"G{i}" for i in range(n)],
+        "UMAP 1": rng.normal(size=n),
+        "UMAP 2": rng.normal(size=n),
+        "cluster": rng.integers(-1, 10, n),
+        "prioritised": (rng.random(n) < 0.01).astype(int),
+    }).to_csv(folder / EMBEDDING_FILE, sep="\t", index=False)
+    return folder / EMBEDDING_FILE
+
+
+@pytest.fixture
+def embedding(tmp_path):
+    _write_tsv(tmp_path, 5000)
+    assert convert_all_embeddings(tmp_path) == 1
+    assert convert_all_embeddings(tmp_path) == 0
+    return UmapStore(tmp_path).get("Reactome_v2", "EFO_0000094")
+
+
+def test_no_zoom_returns_every_point(embedding):
+    np.testing.assert_array_equal(select_points(embedding), np.arange(len(embedding)))
+
+
+def test_zoom_downsamples_but_keeps_flagged_points(embedding):
+    coarse = select_points(embedding, zoom=0)
+    fine = select_points(embedding, zoom=3)
+    assert len(coarse) < len(fine) <= len(embedding)
+    assert np.all(np.diff(coarse) > 0)
+    flagged = np.flatnonzero(embedding.flags != 0)
+    assert np.isin(flagged, coarse).all()
+
+
+def test_bbox_filters_points(embedding):
+    idx = select_points(embedding, zoom=1, bbox=(0.0, 0.0, 1.0, 1.0))
+    assert len(idx) > 0
+    assert ((embedding.x[idx] >= 0) & (embedding.x[idx] <= 1)).all()
+    assert ((embedding.y[idx] >= 0) & (embedding.y[idx] <= 1)).all()
+
+
+def test_invalid_arguments(embedding):
+    with pytest.raises(ValueError):
+        select_points(embedding, zoom=99)
+    with pytest.raises(ValueError):
+        select_points(embedding, bbox=(1.0, 0.0, 0.0, 1.0))
+
+
+def test_store_serves_replaced_and_new_embeddings(tmp_path):
+    tsv_path = _write_tsv(tmp_path, 100)
+    store = UmapStore(tmp_path)
+    assert len(store.get("Reactome_v2", "EFO_0000094")) == 100
+    assert store.embeddings() == ["Reactome_v2"]
+
+    # A replaced TSV is reloaded, even when its mtime is older than the Arrow file
+    _write_tsv(tmp_path, 200)
+    os.utime(tsv_path, ns=(10**18, 10**18))
+    assert len(store.get("Reactome_v2", "EFO_0000094")) == 200
+
+    _write_tsv(tmp_path, 50, embedding="GO_v1")
+    assert store.embeddings() == ["GO_v1", "Reactome_v2"]
+    assert len(store.get("GO_v1", "EFO_0000094")) == 50
+
+    tsv_path.unlink()
+    assert store.get("Reactome_v2", "EFO_0000094") is None